@@ -1,88 +1,426 @@
-import tempfile
+import asyncio
+import threading
 import time
 from contextlib import asynccontextmanager
-from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
 import uvicorn
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from model.azure.detect import AzureLLMDetector
-from model.clip.detect import CLIPDetector
-from model.main.detect import Pipeline
+from model.utils.batching import MicroBatcher
+from model.utils.cache import ResultCache, image_key
 from model.utils.config import settings
+from model.utils.executor import ExecutorBusy, InferenceExecutor
 from model.utils.logger import setup_logger
 from model.utils.preprocess import validate_image
-from model.yolo.detect import YOLODetector
+from model.utils.tiers import LoadTierSelector
+from model.utils.timing import StageTimer
+from model.workers import (WorkerPool, build_detector, clip_tier_names,
+                           clip_tiers, parse_names, tile_size,
+                           warmup_detector)
 
 logger = setup_logger(__name__, "api.log")
 
 
 class DetectResponse(BaseModel):
     detections: List[str]
+    # Model that served a tiered detector (CLIP), so clients can tell a load-shed answer apart
+    tier: Optional[str] = None
+
+
+class BatchItemResponse(DetectResponse):
+    index: int
+    filename: Optional[str] = None
+    error: Optional[str] = None
+    decode_ms: float = 0.0
+    elapsed_ms: float = 0.0
+
+
+class BatchDetectResponse(BaseModel):
+    results: List[BatchItemResponse]
+    elapsed_ms: float
+
+# "clip" is the primary CLIP tier; "clip:1", "clip:2"... are lighter fallbacks from CLIP_TIERS
+CLIP_TIERS = dict(zip(clip_tier_names(), clip_tiers()))
+DETECTOR_NAMES = ("main", "yolo", "clip", "azure") + tuple(CLIP_TIERS)[1:]
 
 detectors = {}
+# One lock per detector: concurrent first requests build it once, and
+# loading one detector never waits on another
+_detector_locks = {name: threading.Lock() for name in DETECTOR_NAMES}
+
+# Optional multi-process mode: these detectors live in worker processes instead.
+# The pool itself is created in lifespan: spawned workers re-import this module
+# as __mp_main__, and must not start pools (or open caches) of their own.
+WORKER_DETECTORS = tuple(parse_names(settings.worker_detectors)) if settings.worker_processes > 0 else ()
+worker_pool = None
+
+clip_selector = LoadTierSelector(
+    max_pending=settings.clip_fallback_queue_depth,
+    p95_ms=settings.clip_fallback_p95_ms,
+    window=settings.clip_latency_window,
+    max_age_s=settings.clip_latency_max_age_s,
+)
 
-def _save_temp(upload: UploadFile) -> Path:
-    suffix = Path(upload.filename or "img.jpg").suffix or ".jpg"
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+# Created in lifespan, like worker_pool
+result_cache = None
+
+def _read_upload(upload: UploadFile) -> bytes:
     data = upload.file.read()
 
     max_bytes = settings.max_file_mb * 1024 * 1024
     if settings.preprocess and len(data) > max_bytes:
-        tmp.close()
-        Path(tmp.name).unlink(missing_ok=True)
         raise HTTPException(
             status_code=413,
             detail=f"File too large ({len(data) / 1024 / 1024:.1f} MB, max {settings.max_file_mb} MB)",
         )
 
-    tmp.write(data)
-    tmp.close()
-    return Path(tmp.name)
+    return data
+
 
+def _decode_and_preprocess(data: bytes, detector: Optional[str] = None) -> np.ndarray:
+    """Decode uploaded bytes in memory, validate, and normalize for inference.
 
-def _read_and_preprocess(path: Path) -> np.ndarray:
-    """Read image from disk, validate, and normalize for inference."""
-    img_bgr = cv2.imread(str(path))
+    Tiled detectors keep up to TILE_MAX_LONG_SIDE pixels instead of MAX_LONG_SIDE.
+    """
+    img_bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
     if img_bgr is None:
         raise HTTPException(status_code=400, detail="Could not decode image")
     img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
     if not settings.preprocess:
         return img_rgb
-    file_size = path.stat().st_size
     try:
-        return validate_image(img_rgb, file_size=file_size)
+        max_long_side = settings.tile_max_long_side if detector and tile_size(detector) else None
+        return validate_image(img_rgb, file_size=len(data), max_long_side=max_long_side)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 def _get_detector(name: str):
-    if name not in detectors:
-        logger.info(f"Lazy-loading {name} detector...")
-        if name == "yolo":
-            detectors["yolo"] = YOLODetector()
-        elif name == "azure":
-            detectors["azure"] = AzureLLMDetector()
-        elif name == "clip":
-            detectors["clip"] = CLIPDetector()
-        elif name == "main":
-            model_dir = Path(__file__).resolve().parent / "main" / "assets"
-            detectors["main"] = Pipeline(model_dir=model_dir, gd_threshold=settings.gd_threshold)
-        logger.info(f"{name} detector loaded")
+    detector = detectors.get(name)
+    if detector is not None:
+        return detector
+    with _detector_locks[name]:
+        if name not in detectors:
+            logger.info(f"Loading {name} detector...")
+            detectors[name] = build_detector(name)
+            logger.info(f"{name} detector loaded")
     return detectors[name]
 
 
+def _call_detector(name: str, method: str, *args):
+    """Runs inside an executor thread, so lazy loading never blocks the event loop."""
+    if worker_pool is not None and name in WORKER_DETECTORS:
+        return worker_pool.call(name, method, *args)
+    return getattr(_get_detector(name), method)(*args)
+
+
+def _max_workers(name: str) -> int:
+    if name in WORKER_DETECTORS:
+        # One dispatching thread per worker process
+        return settings.worker_processes
+    if name == "azure":
+        return settings.azure_workers
+    return settings.inference_workers
+
+
+# One bounded pool per detector so a slow detector cannot starve the others.
+# Azure is network-bound and gets more threads than the local models.
+executors = {
+    name: InferenceExecutor(
+        name,
+        max_workers=_max_workers(name),
+        max_queue=settings.inference_queue_size,
+    )
+    for name in DETECTOR_NAMES
+}
+
+
+async def _run_inference(name: str, method: str, *args):
+    try:
+        return await executors[name].run(_call_detector, name, method, *args)
+    except ExecutorBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+async def _predict_main_batch(images: List[np.ndarray]) -> List[list]:
+    return await _run_inference("main", "predict_batch", images)
+
+
+# Concurrent /detect/main requests are coalesced into one batched pipeline pass
+main_batcher = MicroBatcher(
+    _predict_main_batch,
+    max_batch_size=settings.main_batch_size,
+    max_wait_ms=settings.main_batch_wait_ms,
+    max_pending=settings.inference_queue_size * settings.main_batch_size,
+    name="main",
+)
+
+
+def _detector_params(name: str) -> dict:
+    """Settings that change a detector's output, folded into its cache key."""
+    if name == "main":
+        return {
+            "gd_threshold": settings.gd_threshold,
+            "gd_nms_iou": settings.gd_nms_iou,
+            "gd_max_proposals": settings.gd_max_proposals,
+            "gd_min_box_area": settings.gd_min_box_area,
+            "class_merge_iou": settings.class_merge_iou,
+            "index": settings.main_index,
+            "nprobe": settings.main_nprobe,
+            "prototypes": settings.main_prototypes_file,
+            "vote": settings.main_vote,
+            "knn_k": settings.main_knn_k,
+            "precision": settings.main_precision,
+            "backend": settings.main_backend,
+            "tile": (tile_size("main"), settings.tile_overlap),
+        }
+    if name == "yolo":
+        return {
+            "confidence_threshold": settings.yolo_confidence_threshold,
+            "iou_threshold": settings.yolo_iou_threshold,
+            "export_format": settings.yolo_export_format,
+            "tile": (tile_size("yolo"), settings.tile_overlap),
+        }
+    if name in CLIP_TIERS:
+        return {
+            "tier": CLIP_TIERS[name],
+            "sim_threshold": settings.clip_sim_threshold,
+            "precision": settings.clip_precision,
+            "mode": settings.clip_mode,
+            "region_scales": settings.clip_region_scales,
+        }
+    if name == "azure":
+        return {"model": settings.model_deployment_name}
+    return {}
+
+
+async def _infer_names(name: str, img_rgb: np.ndarray) -> List[str]:
+    """Run one image through a detector and reduce its output to unique class names."""
+    if name == "main":
+        try:
+            raw = await main_batcher.submit(img_rgb)
+        except ExecutorBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        detections = [d["class"] if "class" in d else d["predictions"][0]["class"] for d in raw]
+        return list(dict.fromkeys(detections))
+    if name == "yolo":
+        raw = await _run_inference("yolo", "predict_detailed", img_rgb)
+        return list(dict.fromkeys(d["class"] for d in raw))
+    if name in CLIP_TIERS:
+        results = await _run_clip(name, "predict_detailed", img_rgb)
+        return list(dict.fromkeys(label for label, _ in results))
+    return await _run_inference("azure", "predict_ingredients", img_rgb)
+
+
+async def _run_clip(name: str, method: str, *args):
+    """CLIP inference on one tier; the primary's calls are timed (queue wait included) for the fallback's p95."""
+    if name != "clip":
+        return await _run_inference(name, method, *args)
+    t0 = time.perf_counter()
+    result = await _run_inference(name, method, *args)
+    # Only completed calls count: an instant 503 would look like a fast sample exactly under overload
+    clip_selector.latency.record((time.perf_counter() - t0) * 1000)
+    return result
+
+
+def _route(name: str) -> str:
+    """The tier that serves a request for ``name``; only CLIP has more than one.
+
+    Under load (see LoadTierSelector), or whenever the primary's executor is
+    full and would reject with 503, requests go to the first fallback tier
+    that still has queue room, or the lightest one if all are saturated.
+    """
+    if name != "clip" or len(CLIP_TIERS) == 1:
+        return name
+    primary = executors["clip"]
+    degraded = clip_selector.update(primary.pending)
+    if not degraded and primary.pending < primary.capacity:
+        return "clip"
+    fallbacks = list(CLIP_TIERS)[1:]
+    for tier in fallbacks:
+        if executors[tier].pending < executors[tier].capacity:
+            return tier
+    return fallbacks[-1]
+
+
+def _tier_label(name: str) -> Optional[str]:
+    return CLIP_TIERS[name][0] if name in CLIP_TIERS else None
+
+
+async def _infer_names_batch(name: str, images: List[np.ndarray]) -> List[List[str]]:
+    if name in CLIP_TIERS:
+        # One call; the detector encodes CLIP_BATCH_SIZE images per forward pass
+        results = await _run_clip(name, "predict_batch", images)
+        return [list(dict.fromkeys(label for label, _ in r)) for r in results]
+    if name == "yolo":
+        # One call; the detector predicts YOLO_BATCH_SIZE images at a time
+        results = await _run_inference("yolo", "predict_batch", images)
+        return [list(dict.fromkeys(d["class"] for d in r)) for r in results]
+    # main batches through the shared batcher so these images coalesce with other traffic;
+    # azure gets one executor job per image, capped by the fan-out limit
+    limit = _fanout_limit(name)
+    return await asyncio.gather(*(_bounded(limit, _infer_names(name, img)) for img in images))
+
+
+def _fanout_limit(name: str) -> Optional[asyncio.Semaphore]:
+    """Caps how many executor jobs one batch request has in flight.
+
+    A batch can hold more images than the executor accepts (workers +
+    INFERENCE_QUEUE_SIZE), so without this the extra jobs are rejected as
+    busy. main goes through the micro-batcher and needs no cap.
+    """
+    if name == "main":
+        return None
+    return asyncio.Semaphore(executors[name].max_workers)
+
+
+async def _bounded(limit: Optional[asyncio.Semaphore], coro):
+    if limit is None:
+        return await coro
+    async with limit:
+        return await coro
+
+
+def _cache_key(name: str, img_rgb: np.ndarray) -> Optional[str]:
+    if result_cache is None:
+        return None
+    return image_key(img_rgb, name, **_detector_params(name))
+
+
+def _cache_lookup(name: str, images: List[np.ndarray]) -> tuple:
+    """(keys, cached results) per image; hashes every pixel and may hit sqlite, so run it in a thread."""
+    keys = [_cache_key(name, img) for img in images]
+    return keys, [result_cache.get(key) if key is not None else None for key in keys]
+
+
+def _cache_store(entries: List[tuple]) -> None:
+    for key, detections in entries:
+        result_cache.put(key, detections)
+
+
+async def _detect_many(name: str, images: List[np.ndarray]) -> Tuple[List[List[str]], Optional[str]]:
+    """Ingredient names per image, served from the result cache when possible, and the tier used."""
+    name = _route(name)
+    if result_cache is not None:
+        keys, results = await asyncio.to_thread(_cache_lookup, name, images)
+    else:
+        keys, results = [None] * len(images), [None] * len(images)
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        fresh = await _infer_names_batch(name, [images[i] for i in missing])
+        for i, detections in zip(missing, fresh):
+            results[i] = detections
+        # Detectors log and swallow their own errors as empty results; don't pin those
+        entries = [(keys[i], results[i]) for i in missing if keys[i] is not None and results[i]]
+        if entries:
+            await asyncio.to_thread(_cache_store, entries)
+
+    return results, _tier_label(name)
+
+
+async def _detect(name: str, img_rgb: np.ndarray) -> Tuple[List[str], Optional[str]]:
+    results, tier = await _detect_many(name, [img_rgb])
+    return results[0], tier
+
+
+startup_timer = StageTimer()
+
+# Preload progress per name ("workers" or a detector): loading, ready or failed
+preload_state = {}
+
+
+def _preload_local(name: str) -> None:
+    with startup_timer.stage(name):
+        detector = _get_detector(name)
+    if settings.preload_warmup:
+        with startup_timer.stage(f"{name}_warmup"):
+            warmup_detector(name, detector)
+
+
+def _preload_workers() -> None:
+    # Workers build (and warm up) their detectors in their initializer
+    with startup_timer.stage("workers"):
+        worker_pool.warmup()
+
+
+async def _preload_one(name: str, fn, *args) -> None:
+    try:
+        await asyncio.to_thread(fn, *args)
+        preload_state[name] = "ready"
+    except Exception as e:
+        logger.error(f"Preloading {name} failed: {e}")
+        preload_state[name] = f"failed: {e}"
+
+
+def _preload_plan() -> list:
+    """(name, fn, args) for everything loaded at startup."""
+    plan = []
+    if worker_pool is not None:
+        plan.append(("workers", _preload_workers, ()))
+    for name in parse_names(settings.preload_detectors):
+        if name in WORKER_DETECTORS:
+            continue
+        if name not in DETECTOR_NAMES:
+            logger.warning(f"Unknown detector in PRELOAD_DETECTORS: {name}")
+            continue
+        plan.append((name, _preload_local, (name,)))
+    return plan
+
+
+async def _preload(plan: list) -> None:
+    """Load the preload set concurrently, each entry in its own thread."""
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_preload_one(name, fn, *args) for name, fn, args in plan))
+    logger.info(
+        f"Preload finished in {time.perf_counter() - t0:.2f}s: {startup_timer.summary()}",
+        extra={"startup_s": startup_timer.stages},
+    )
+
+
+def _is_ready() -> bool:
+    return all(state == "ready" for state in preload_state.values())
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Loading main pipeline...")
-    _get_detector("main")
-    logger.info("Main pipeline ready (other detectors will lazy-load on first request)")
+    global worker_pool, result_cache
+    if WORKER_DETECTORS:
+        worker_pool = WorkerPool(
+            WORKER_DETECTORS,
+            num_workers=settings.worker_processes,
+            torch_threads=settings.worker_torch_threads,
+        )
+    if settings.cache_enabled:
+        result_cache = ResultCache(
+            max_entries=settings.cache_max_entries,
+            ttl_s=settings.cache_ttl_s,
+            disk_path=settings.cache_disk_path or None,
+            disk_max_entries=settings.cache_disk_max_entries,
+        )
+
+    plan = _preload_plan()
+    # Mark everything as loading before serving so /ready never reports a premature 200
+    for name, _, _ in plan:
+        preload_state[name] = "loading"
+
+    preload_task = asyncio.create_task(_preload(plan))
+    main_batcher.start()
+    logger.info(f"Preloading {list(preload_state)} in the background (others load on first request)")
     yield
+    preload_task.cancel()
+    await main_batcher.stop()
+    for executor in executors.values():
+        executor.shutdown()
+    if worker_pool is not None:
+        worker_pool.shutdown()
+        worker_pool = None
     detectors.clear()
 
 
@@ -99,77 +437,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def _decode_timed(data: bytes, detector: str):
+    """Decode in a thread: imdecode and resize of a large upload would otherwise stall the event loop."""
+    t0 = time.time()
+    img_rgb = await asyncio.to_thread(_decode_and_preprocess, data, detector)
+    return img_rgb, (time.time() - t0) * 1000
+
+
 @app.post("/detect/yolo", response_model=DetectResponse)
 async def detect_yolo(file: UploadFile = File(...)):
-    path = _save_temp(file)
+    data = _read_upload(file)
     try:
         t0 = time.time()
-        # Validate and downscale — write back so YOLO reads the normalized image
-        img_rgb = _read_and_preprocess(path)
-        cv2.imwrite(str(path), cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR))
-        detector = _get_detector("yolo")
-        raw = detector.predict_detailed(path)
-        detections = list(dict.fromkeys(d["class"] for d in raw))
+        img_rgb, _ = await _decode_timed(data, "yolo")
+        detections, _ = await _detect("yolo", img_rgb)
         logger.info(f"YOLO: {len(detections)} detections in {time.time() - t0:.2f}s")
         return DetectResponse(detections=detections)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"YOLO error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        path.unlink(missing_ok=True)
 
 
 @app.post("/detect/azure", response_model=DetectResponse)
 async def detect_azure(file: UploadFile = File(...)):
-    path = _save_temp(file)
+    data = _read_upload(file)
     try:
         t0 = time.time()
-        detector = _get_detector("azure")
-        detections = detector.predict_ingredients(path)
+        img_rgb, _ = await _decode_timed(data, "azure")
+        detections, _ = await _detect("azure", img_rgb)
         logger.info(f"Azure: {len(detections)} detections in {time.time() - t0:.2f}s")
         return DetectResponse(detections=detections)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Azure error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        path.unlink(missing_ok=True)
 
 
 @app.post("/detect/clip", response_model=DetectResponse)
 async def detect_clip(file: UploadFile = File(...)):
-    path = _save_temp(file)
+    data = _read_upload(file)
     try:
         t0 = time.time()
-        # Validate and downscale — write back so CLIP reads the normalized image
-        img_rgb = _read_and_preprocess(path)
-        cv2.imwrite(str(path), cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR))
-        detector = _get_detector("clip")
-        results = detector.predict_detailed(path)
-        detections = list(dict.fromkeys(name for name, _ in results))
-        logger.info(f"CLIP: {len(detections)} detections in {time.time() - t0:.2f}s")
-        return DetectResponse(detections=detections)
+        img_rgb, _ = await _decode_timed(data, "clip")
+        detections, tier = await _detect("clip", img_rgb)
+        logger.info(f"CLIP ({tier}): {len(detections)} detections in {time.time() - t0:.2f}s")
+        return DetectResponse(detections=detections, tier=tier)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"CLIP error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        path.unlink(missing_ok=True)
 
 
 @app.post("/detect/main", response_model=DetectResponse)
 async def detect_main(file: UploadFile = File(...)):
-    path = _save_temp(file)
+    data = _read_upload(file)
     try:
         t0 = time.time()
-        pipeline = _get_detector("main")
-        img_rgb = _read_and_preprocess(path)
-        raw = pipeline.predict(img_rgb)
-        detections = []
-        for d in raw:
-            if "class" in d:
-                detections.append(d["class"])
-            else:
-                detections.append(d["predictions"][0]["class"])
-        detections = list(dict.fromkeys(detections))
+        img_rgb, _ = await _decode_timed(data, "main")
+        detections, _ = await _detect("main", img_rgb)
         logger.info(f"Main: {len(detections)} detections in {time.time() - t0:.2f}s")
         return DetectResponse(detections=detections)
     except HTTPException:
@@ -177,13 +506,137 @@ async def detect_main(file: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"Main pipeline error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _error_detail(e: Exception) -> str:
+    return e.detail if isinstance(e, HTTPException) else str(e)
+
+
+def _chunk_size(name: str) -> int:
+    """Images per detector call when streaming a batch: a full predict_batch for yolo/clip, else one."""
+    if name == "yolo":
+        return settings.yolo_batch_size
+    if name in CLIP_TIERS:
+        return settings.clip_batch_size
+    return 1
+
+
+async def _batch_items(name: str, uploads: List[tuple], offset: int = 0) -> List[BatchItemResponse]:
+    """Decode uploads concurrently and run the decodable ones through one _detect_many call.
+
+    Undecodable images become per-item errors; inference errors propagate.
+    """
+    decoded = await asyncio.gather(
+        *(_decode_timed(data, name) for _, data in uploads), return_exceptions=True
+    )
+    ok = [i for i, d in enumerate(decoded) if not isinstance(d, BaseException)]
+
+    t_infer = time.time()
+    names, tier = await _detect_many(name, [decoded[i][0] for i in ok])
+    infer_ms = (time.time() - t_infer) * 1000
+    detections_by_index = dict(zip(ok, names))
+
+    results = []
+    for i, ((filename, _), d) in enumerate(zip(uploads, decoded)):
+        if isinstance(d, BaseException):
+            results.append(BatchItemResponse(
+                index=offset + i, filename=filename, detections=[], error=_error_detail(d)
+            ))
+            continue
+        decode_ms = d[1]
+        results.append(BatchItemResponse(
+            index=offset + i,
+            filename=filename,
+            detections=detections_by_index[i],
+            tier=tier,
+            decode_ms=round(decode_ms, 1),
+            elapsed_ms=round(decode_ms + infer_ms, 1),
+        ))
+    return results
+
+
+async def _stream_chunk(name: str, offset: int, uploads: List[tuple], limit) -> List[BatchItemResponse]:
+    try:
+        return await _bounded(limit, _batch_items(name, uploads, offset))
+    except Exception as e:
+        # A failed chunk reports an error per image instead of ending the stream
+        return [
+            BatchItemResponse(index=offset + i, filename=filename, detections=[], error=_error_detail(e))
+            for i, (filename, _) in enumerate(uploads)
+        ]
+
+
+async def _stream_batch(name: str, uploads: List[tuple]):
+    size = _chunk_size(name)
+    limit = _fanout_limit(name)
+    tasks = [
+        asyncio.ensure_future(_stream_chunk(name, start, uploads[start:start + size], limit))
+        for start in range(0, len(uploads), size)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for item in await task:
+                yield item.model_dump_json() + "\n"
     finally:
-        path.unlink(missing_ok=True)
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/detect/{detector}/batch", response_model=BatchDetectResponse)
+async def detect_batch(
+    detector: str,
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(False, description="Stream one NDJSON line per image as it completes"),
+):
+    if detector not in executors:
+        raise HTTPException(status_code=404, detail=f"Unknown detector: {detector}")
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files ({len(files)}, max {settings.max_batch_files})",
+        )
+
+    # Read everything up front: uploads are closed once a streaming response starts
+    uploads = [(f.filename, _read_upload(f)) for f in files]
+
+    if stream:
+        return StreamingResponse(_stream_batch(detector, uploads), media_type="application/x-ndjson")
+
+    t0 = time.time()
+    try:
+        results = await _batch_items(detector, uploads)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Batch {detector} error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    elapsed_ms = (time.time() - t0) * 1000
+    logger.info(f"Batch {detector}: {len(uploads)} images in {elapsed_ms / 1000:.2f}s")
+    return BatchDetectResponse(results=results, elapsed_ms=round(elapsed_ms, 1))
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once every preloaded detector is loaded and warmed up, 503 before."""
+    body = {"ready": _is_ready(), "preload": preload_state}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "detectors": list(detectors.keys())}
+    return {
+        "status": "ok",
+        "detectors": list(detectors.keys()),
+        "pending": {name: executor.pending for name, executor in executors.items()},
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "startup_s": startup_timer.stages,
+        "clip_tiers": {
+            "tiers": {name: model for name, (model, _) in CLIP_TIERS.items()},
+            "degraded": clip_selector.degraded,
+            "p95_ms": clip_selector.latency.percentile(95),
+        },
+    }
 
 
 if __name__ == "__main__":
@@ -3,8 +3,10 @@ import base64
 import json
 import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 
+import cv2
+import numpy as np
 from openai import AzureOpenAI
 
 from model.utils.config import settings
@@ -35,10 +37,21 @@ class AzureLLMDetector:
         with open(self.classes_path, "r", encoding="utf-8") as f:
             return [line.strip() for line in f if line.strip()]
 
-    def _encode_image(self, image_path: Path) -> str:
-        with open(image_path, "rb") as f:
+    def _encode_image(self, image: Union[Path, np.ndarray]) -> str:
+        if isinstance(image, np.ndarray):
+            # In-memory RGB array: JPEG-encode without touching the filesystem
+            ok, buf = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            if not ok:
+                raise ValueError("Could not encode image as JPEG")
+            return base64.b64encode(buf.tobytes()).decode("utf-8")
+        with open(image, "rb") as f:
             return base64.b64encode(f.read()).decode("utf-8")
 
+    def _describe(self, image: Union[Path, np.ndarray]) -> str:
+        if isinstance(image, np.ndarray):
+            return f"<array {image.shape[1]}x{image.shape[0]}>"
+        return str(image)
+
     def _build_prompt(self) -> str:
         ingredients_list = ", ".join(self.ingredients)
 
@@ -61,12 +74,14 @@ class AzureLLMDetector:
         """
         return prompt
 
-    def predict_ingredients(self, image_path: Path) -> List[str]:
+    def predict_ingredients(self, image: Union[Path, np.ndarray]) -> List[str]:
+        """Ask the LLM for ingredients in an image file or an in-memory RGB array."""
         start_time = time.time()
-        self.logger.info(f"LLM analyzing image: {image_path}")
+        image_desc = self._describe(image)
+        self.logger.info(f"LLM analyzing image: {image_desc}")
 
         try:
-            base64_image = self._encode_image(image_path)
+            base64_image = self._encode_image(image)
             prompt = self._build_prompt()
 
             response = self.client.chat.completions.create(
@@ -100,11 +115,11 @@ class AzureLLMDetector:
             results = [ing for ing in detections if ing in self.ingredients]
 
             elapsed_time = time.time() - start_time
-            self.logger.info(f"LLM detected {len(results)} ingredients in {image_path} (took {elapsed_time:.2f}s)")
+            self.logger.info(f"LLM detected {len(results)} ingredients in {image_desc} (took {elapsed_time:.2f}s)")
             return results
 
         except Exception as e:
-            self.logger.error(f"Error analyzing image {image_path}: {e}")
+            self.logger.error(f"Error analyzing image {image_desc}: {e}")
             return []
 
     def predict_folder(self, folder: Path) -> Dict[str, List[str]]:
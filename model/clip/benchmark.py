@@ -0,0 +1,93 @@
+import argparse
+import json
+from pathlib import Path
+
+import torch
+
+from model.clip.detect import CLIPDetector
+from model.utils.benchmark import (bench_variants, load_named_images,
+                                   print_variant_report)
+
+
+def bench_precision(named_images, runs, model_name, device, precisions, labels=None):
+    """Build one detector per precision and compare latency and returned classes.
+
+    Accuracy is the mean per-image F1 of the returned class set against
+    ``labels`` ({filename: [classes]}) when given, else against fp32.
+    """
+    latencies, outputs = bench_variants(
+        precisions,
+        build=lambda precision: CLIPDetector(model_name=model_name, device=device, precision=precision),
+        predict=lambda detector, img: detector.predict_detailed(img),
+        classes=lambda results: [label for label, _ in results],
+        named_images=named_images,
+        runs=runs,
+    )
+    print_variant_report('CLIP image encoding + scoring, per image:', named_images, latencies, outputs, labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare CLIP detector precision modes on a held-out image set')
+
+    parser.add_argument(
+        '--image',
+        required=True,
+        type=Path,
+        help='Image file or directory of images'
+    )
+    parser.add_argument(
+        '--model_name',
+        type=str,
+        default='ViT-L-14',
+        help='CLIP model name (default: ViT-L-14)'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='Maximum number of images to use (default: 20)'
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='Timed passes over the image set (default: 3)'
+    )
+    parser.add_argument(
+        '--device',
+        default=None,
+        help="Device to run on ('cuda' or 'cpu', default: auto)"
+    )
+    parser.add_argument(
+        '--precisions',
+        nargs='+',
+        default=None,
+        help='Precisions to compare (default: fp32 bf16 int8 on CPU, fp32 fp16 bf16 on CUDA)'
+    )
+    parser.add_argument(
+        '--labels',
+        type=Path,
+        default=None,
+        help='JSON {filename: [classes]} for the held-out set; without it, results are scored against fp32'
+    )
+
+    args = parser.parse_args()
+
+    named_images = load_named_images(args.image, args.limit)
+    if not named_images:
+        raise SystemExit(f'No readable images in {args.image}')
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    precisions = args.precisions or (
+        ['fp32', 'fp16', 'bf16'] if device.startswith('cuda') else ['fp32', 'bf16', 'int8']
+    )
+    if args.labels is None and 'fp32' not in precisions:
+        precisions = ['fp32'] + precisions
+    labels = json.loads(args.labels.read_text()) if args.labels else None
+
+    print(f'\nBenchmarking {precisions} on {len(named_images)} image(s), {args.runs} run(s), device {device}\n')
+    bench_precision(named_images, args.runs, args.model_name, device, precisions, labels)
+
+
+if __name__ == '__main__':
+    main()
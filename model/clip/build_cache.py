@@ -4,55 +4,45 @@ from pathlib import Path
 import open_clip
 import torch
 
-PROMPT_TEMPLATES = [
-    "a photo of {ingredient}",
-    "a close-up photo of {ingredient}",
-    "raw {ingredient} on a plate",
-]
+from model.clip.text_cache import (DEFAULT_CACHE_DIR, PROMPT_TEMPLATES,
+                                   TextEmbeddingCache, encode_classes)
+from model.workers import clip_tiers
 
 DEFAULT_CLASSES = Path(__file__).resolve().parent.parent.parent / "assets" / "classes.txt"
-DEFAULT_OUT = Path(__file__).resolve().parent / ".clip_text_embeds.pt"
 
 
-def build(classes_path: Path, out_path: Path, model_name: str, pretrained: str) -> None:
+def build(classes_path: Path, cache_dir: Path, model_name: str, pretrained: str) -> None:
     ingredients = [l.strip() for l in classes_path.read_text().splitlines() if l.strip()]
     print(f"Loaded {len(ingredients)} ingredients from {classes_path}")
 
-    print(f"Loading CLIP model {model_name} ({pretrained})...")
-    model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained)
-    tokenizer = open_clip.get_tokenizer(model_name)
-    model.eval()
+    cache = TextEmbeddingCache(cache_dir)
 
-    prompts = [
-        tmpl.format(ingredient=ing)
-        for ing in ingredients
-        for tmpl in PROMPT_TEMPLATES
-    ]
+    def encode(classes):
+        # Only load the model when something actually needs encoding
+        print(f"Loading CLIP model {model_name} ({pretrained})...")
+        model, _, _ = open_clip.create_model_and_transforms(model_name, pretrained=pretrained)
+        tokenizer = open_clip.get_tokenizer(model_name)
+        model.eval()
+        print(f"Encoding text embeddings for {len(classes)} new classes...")
+        return encode_classes(model, tokenizer, classes, PROMPT_TEMPLATES)
 
-    tokens = tokenizer(prompts)
-
-    print("Encoding text embeddings...")
-    with torch.no_grad():
-        text_embeds = model.encode_text(tokens)
-        text_embeds /= text_embeds.norm(dim=-1, keepdim=True)
-
-    text_embeds = text_embeds.view(len(ingredients), len(PROMPT_TEMPLATES), -1)
-    text_embeds = text_embeds.mean(dim=1)
-    text_embeds /= text_embeds.norm(dim=-1, keepdim=True)
-
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    torch.save(text_embeds.cpu(), out_path)
-    print(f"Saved embeddings ({text_embeds.shape}) -> {out_path}")
+    text_embeds, n_encoded = cache.get(model_name, pretrained, PROMPT_TEMPLATES, ingredients, encode)
+    path = cache.path_for(model_name, pretrained, PROMPT_TEMPLATES)
+    print(f"Embeddings {tuple(text_embeds.shape)}: {len(ingredients) - n_encoded} cached, {n_encoded} encoded -> {path}")
 
 def main():
     parser = argparse.ArgumentParser(description="Pre-build CLIP text embeddings cache")
     parser.add_argument("--classes", type=Path, default=DEFAULT_CLASSES, help="Path to classes.txt")
-    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="Output .pt file")
+    parser.add_argument("--cache_dir", type=Path, default=DEFAULT_CACHE_DIR, help="Cache directory (one file per model/templates variant)")
     parser.add_argument("--model", default="ViT-L-14", help="CLIP model name")
     parser.add_argument("--pretrained", default="laion2b_s32b_b82k", help="Pretrained weights tag")
+    parser.add_argument("--all_tiers", action="store_true", help="Build every model:pretrained tier in CLIP_TIERS instead of --model/--pretrained")
     args = parser.parse_args()
 
-    build(args.classes, args.out, args.model, args.pretrained)
+    tiers = clip_tiers() if args.all_tiers else [(args.model, args.pretrained)]
+    with torch.no_grad():
+        for model_name, pretrained in tiers:
+            build(args.classes, args.cache_dir, model_name, pretrained)
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,84 @@
 import argparse
 import json
+import math
 import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import open_clip
 import torch
 from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision.ops import roi_align
 
+from model.clip.text_cache import (PROMPT_TEMPLATES, TextEmbeddingCache,
+                                   encode_classes)
 from model.utils.logger import setup_logger
+from model.utils.precision import (PRECISIONS, autocast, quantize_linear,
+                                   resolve_precision)
+
+
+class _ImageFiles(Dataset):
+    """Decodes and preprocesses image files inside DataLoader workers."""
+
+    def __init__(self, paths: List[Path], preprocess):
+        self.paths = paths
+        self.preprocess = preprocess
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int):
+        try:
+            with Image.open(self.paths[i]) as img:
+                return self.preprocess(img.convert("RGB")), i, True
+        except Exception:
+            # Keep the batch shape; the caller reports the file as unreadable
+            return None, i, False
+
+
+def _to_array(img: Image.Image) -> np.ndarray:
+    return np.asarray(img)
+
+
+def _collate(items):
+    ok = [data for data, _, readable in items if readable]
+    # Region mode loads raw arrays of different sizes, which stay a list
+    if ok and isinstance(ok[0], torch.Tensor):
+        ok = torch.stack(ok)
+    return (
+        ok if len(ok) else None,
+        [i for _, i, _ in items],
+        [readable for _, _, readable in items],
+    )
+
+
+def region_grid(height: int, width: int, scales: Sequence[int] = (1, 2, 3), overlap: float = 0.25) -> torch.Tensor:
+    """(K, 4) xyxy boxes of a multi-scale grid of square crops.
+
+    At scale ``s`` the short side is split into ``s`` cells and the long side
+    into as many same-sized cells as it takes to cover it, so a square image
+    gets an s x s grid. Cells are grown by ``overlap`` so objects on cell
+    borders are still seen whole by some crop, then shifted (not clipped)
+    back inside the image so ``roi_align`` never stretches them. Duplicate
+    crops are dropped.
+    """
+    short = min(height, width)
+    boxes, seen = [], set()
+    for s in scales:
+        step = short / s
+        side = min(step * (1 + overlap), short)
+        rows, cols = math.ceil(height / step - 1e-6), math.ceil(width / step - 1e-6)
+        for r in range(rows):
+            for c in range(cols):
+                x1 = min(max((c + 0.5) * width / cols - side / 2, 0.0), width - side)
+                y1 = min(max((r + 0.5) * height / rows - side / 2, 0.0), height - side)
+                key = (round(x1, 3), round(y1, 3), round(side, 3))
+                if key not in seen:
+                    seen.add(key)
+                    boxes.append([x1, y1, x1 + side, y1 + side])
+    return torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4)
 
 
 class CLIPDetector:
@@ -19,30 +89,49 @@ class CLIPDetector:
         classes_path: Optional[Path] = None,
         sim_threshold: float = 0.25,
         top_k: Optional[int] = None,
-        device: Optional[str] = None
+        device: Optional[str] = None,
+        precision: str = "auto",
+        batch_size: int = 32,
+        text_cache_dir: Optional[Path] = None,
+        mode: str = "image",
+        region_scales: Sequence[int] = (1, 2, 3),
     ):
         self.model_name = model_name
         self.pretrained = pretrained
         self.sim_threshold = sim_threshold
         self.top_k = top_k
+        self.batch_size = max(1, batch_size)
+        # "regions" scores every crop of a multi-scale grid and keeps each class's best crop
+        assert mode in ("image", "regions"), f"mode must be 'image' or 'regions', got {mode!r}"
+        self.mode = mode
+        self.region_scales = tuple(region_scales)
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.precision = resolve_precision(precision, torch.device(self.device))
 
         self.classes_path = classes_path or Path(__file__).parent / "../../assets/classes.txt"
-        self.embed_cache = Path(__file__).parent / ".clip_text_embeds.pt"
+        self.text_cache = TextEmbeddingCache(text_cache_dir) if text_cache_dir else TextEmbeddingCache()
 
-        self.image_exts = {".jpg", ".jpeg", ".png", ".webp"}
-        self.prompt_templates = [
-            "a photo of {ingredient}",
-            "a close-up photo of {ingredient}",
-            "raw {ingredient} on a plate",
-        ]
+        self.image_exts = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+        self.prompt_templates = list(PROMPT_TEMPLATES)
 
         self.ingredients = self._load_ingredients()
+        # Object array so selected class indices map to names with one fancy-index
+        self._names = np.array(self.ingredients, dtype=object)
 
         self.logger = setup_logger(__name__, "clip.log")
 
         self.model, self.preprocess, self.tokenizer = self._load_model()
         self.text_embeds = self._build_or_load_text_embeddings()
+        # Text embeddings are always built in fp32 so the on-disk cache does not depend on precision
+        self._apply_precision()
+
+        # Region crops skip the PIL preprocess and are resized and normalized on the device
+        image_size = self.model.visual.image_size
+        self.input_size = tuple(image_size) if isinstance(image_size, (tuple, list)) else (image_size, image_size)
+        mean = getattr(self.model.visual, "image_mean", None) or open_clip.OPENAI_DATASET_MEAN
+        std = getattr(self.model.visual, "image_std", None) or open_clip.OPENAI_DATASET_STD
+        self._mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1)
+        self._std = torch.tensor(std, device=self.device).view(1, 3, 1, 1)
 
     def _load_ingredients(self) -> List[str]:
         with open(self.classes_path, "r", encoding="utf-8") as f:
@@ -58,80 +147,227 @@ class CLIPDetector:
         model = model.to(self.device).eval()
         return model, preprocess, tokenizer
 
+    def _apply_precision(self) -> None:
+        if self.precision == "fp16":
+            self.model.half()
+        elif self.precision == "int8":
+            quantize_linear(self.model)
+        self.logger.info(f"CLIP precision: {self.precision}")
+
     def _build_or_load_text_embeddings(self) -> torch.Tensor:
-        if self.embed_cache.exists():
-            self.logger.info("Loading cached text embeddings...")
-            return torch.load(self.embed_cache, map_location=self.device)
+        # Keyed by model, weights and templates, and by class name inside, so a
+        # vocabulary edit only encodes the new classes
+        def encode(classes: List[str]) -> torch.Tensor:
+            self.logger.info(f"Encoding text embeddings for {len(classes)} classes...")
+            return encode_classes(self.model, self.tokenizer, classes, self.prompt_templates, self.device)
+
+        text_embeds, n_encoded = self.text_cache.get(
+            self.model_name, self.pretrained, self.prompt_templates, self.ingredients, encode
+        )
+        self.logger.info(
+            f"Text embeddings ready ({len(self.ingredients) - n_encoded} cached, {n_encoded} encoded)"
+        )
+        return text_embeds.to(self.device)
 
-        self.logger.info("Building text embeddings (one-time)...")
-        prompts = []
-        for ingredient in self.ingredients:
-            for tmpl in self.prompt_templates:
-                prompts.append(tmpl.format(ingredient=ingredient))
+    def _open_image(self, image: Union[Path, np.ndarray]) -> Image.Image:
+        if isinstance(image, np.ndarray):
+            return Image.fromarray(image)
+        return Image.open(image).convert("RGB")
 
-        tokens = self.tokenizer(prompts).to(self.device)
+    def _as_array(self, image: Union[Path, np.ndarray]) -> np.ndarray:
+        return image if isinstance(image, np.ndarray) else np.asarray(self._open_image(image))
 
-        with torch.no_grad():
-            text_embeds = self.model.encode_text(tokens)
-            text_embeds /= text_embeds.norm(dim=-1, keepdim=True)
+    def _describe(self, image: Union[Path, np.ndarray]) -> str:
+        if isinstance(image, np.ndarray):
+            return f"<array {image.shape[1]}x{image.shape[0]}>"
+        return str(image)
+
+    def _similarities(self, image_input: torch.Tensor) -> torch.Tensor:
+        """(N, C) cosine similarities of a preprocessed image batch against the class text embeddings."""
+        image_input = image_input.to(self.device, non_blocking=True)
+        if self.precision == "fp16":
+            image_input = image_input.half()
 
-        text_embeds = text_embeds.view(
-            len(self.ingredients),
-            len(self.prompt_templates),
-            -1
+        with torch.no_grad():
+            with autocast(self.precision, torch.device(self.device)):
+                img_emb = self.model.encode_image(image_input)
+            img_emb = img_emb.float()
+            img_emb /= img_emb.norm(dim=-1, keepdim=True)
+            return img_emb @ self.text_embeds.T
+
+    def _crops(self, img_rgb: np.ndarray, boxes: torch.Tensor) -> torch.Tensor:
+        """All boxes of one image resized to the model input and normalized, in one roi_align call.
+
+        Adaptive sampling averages several source pixels per output pixel, so
+        large crops are downsampled without aliasing.
+        """
+        img = torch.from_numpy(np.ascontiguousarray(img_rgb)).to(self.device)
+        img = img.permute(2, 0, 1).float().div_(255).unsqueeze(0)
+        boxes = boxes.to(self.device, torch.float32)
+        rois = torch.cat([boxes.new_zeros((len(boxes), 1)), boxes], dim=1)
+        crops = roi_align(img, rois, output_size=self.input_size, sampling_ratio=-1, aligned=True)
+        return (crops - self._mean) / self._std
+
+    def _region_similarities(
+        self,
+        images: Sequence[Union[Path, np.ndarray]],
+        boxes: Optional[Sequence[Optional[torch.Tensor]]] = None,
+    ) -> torch.Tensor:
+        """(N, C) per-class max similarity over each image's regions.
+
+        Crops from every image are encoded together, batch_size at a time, so
+        a handful of images costs a few forward passes rather than one per region.
+        """
+        crops, counts = [], []
+        for img, img_boxes in zip(images, boxes or [None] * len(images)):
+            img = self._as_array(img)
+            if img_boxes is None:
+                img_boxes = region_grid(img.shape[0], img.shape[1], self.region_scales)
+            img_boxes = torch.as_tensor(img_boxes, dtype=torch.float32).reshape(-1, 4)
+            if len(img_boxes):
+                crops.append(self._crops(img, img_boxes))
+            counts.append(len(img_boxes))
+
+        if not crops:
+            # No regions at all: every class stays at -inf, which selects nothing
+            return self.text_embeds.new_full((len(counts), len(self.ingredients)), float("-inf")).float()
+
+        crops = torch.cat(crops)
+        sims = torch.cat([
+            self._similarities(crops[start:start + self.batch_size])
+            for start in range(0, len(crops), self.batch_size)
+        ])
+
+        owners = torch.repeat_interleave(
+            torch.arange(len(counts), device=sims.device),
+            torch.tensor(counts, device=sims.device),
         )
+        out = sims.new_full((len(counts), sims.shape[1]), float("-inf"))
+        return out.scatter_reduce_(0, owners[:, None].expand_as(sims), sims, "amax")
 
-        text_embeds = text_embeds.mean(dim=1)
-        text_embeds /= text_embeds.norm(dim=-1, keepdim=True)
+    def _image_similarities(self, images: Sequence[Union[Path, np.ndarray]]) -> torch.Tensor:
+        if self.mode == "regions":
+            return self._region_similarities(images)
+        return self._similarities(torch.stack([self.preprocess(self._open_image(img)) for img in images]))
 
-        torch.save(text_embeds.cpu(), self.embed_cache)
-        return text_embeds.to(self.device)
+    def _top_matches(
+        self,
+        sims: torch.Tensor,
+        k: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(indices, scores, counts) of the best classes per row of (N, C) sims.
+
+        One topk over the whole batch, sized to the most classes any row
+        keeps, so only (N, k) arrays leave the device. Rows are sorted best
+        first and row i's matches are its first ``counts[i]`` entries.
+        """
+        n, num_classes = sims.shape
+        k = min(k or num_classes, num_classes)
+        if threshold is not None:
+            k = min(k, int((sims >= threshold).sum(dim=1).max())) if n else 0
+        if k == 0:
+            empty = np.zeros((n, 0))
+            return empty.astype(np.int64), empty.astype(np.float32), np.zeros(n, dtype=np.int64)
+
+        scores, indices = torch.topk(sims, k, dim=1)
+        if threshold is None:
+            counts = torch.full((n,), k)
+        else:
+            # Scores are sorted, so the mask is a prefix of each row
+            counts = (scores >= threshold).sum(dim=1)
+        return indices.cpu().numpy(), scores.cpu().numpy(), counts.cpu().numpy()
+
+    def _select(self, sims: torch.Tensor) -> List[List[Tuple[str, float]]]:
+        """Per row of (N, C) sims: classes above the threshold, best first, capped at top_k."""
+        indices, scores, counts = self._top_matches(sims, self.top_k, self.sim_threshold)
+        # Only the survivors are mapped to names
+        return [
+            list(zip(self._names[idx[:n]].tolist(), row[:n].tolist()))
+            for idx, row, n in zip(indices, scores, counts)
+        ]
 
-    def predict_ingredients(self, image_path: Path) -> List[str]:
-        return [name for name, _ in self.predict_detailed(image_path)]
+    def predict_ingredients(self, image: Union[Path, np.ndarray]) -> List[str]:
+        return [name for name, _ in self.predict_detailed(image)]
 
-    def predict_detailed(self, image_path: Path, debug: bool = False) -> List[Tuple[str, float]]:
+    def predict_detailed(self, image: Union[Path, np.ndarray], debug: bool = False) -> List[Tuple[str, float]]:
+        """Score an image file or an in-memory RGB array against the class text embeddings."""
         start_time = time.time()
-        self.logger.info(f"CLIP analyzing image: {image_path}")
+        image_desc = self._describe(image)
+        self.logger.info(f"CLIP analyzing image: {image_desc}")
 
-        image = Image.open(image_path).convert("RGB")
-        image_input = self.preprocess(image).unsqueeze(0).to(self.device)
-
-        with torch.no_grad():
-            img_emb = self.model.encode_image(image_input)
-            img_emb /= img_emb.norm(dim=-1, keepdim=True)
-            sims = (img_emb @ self.text_embeds.T).squeeze(0)
+        sims = self._image_similarities([image])
 
         if debug:
-            topk = torch.topk(sims, k=min(10, len(self.ingredients)))
+            indices, scores, _ = self._top_matches(sims, k=10)
             print("\n[DEBUG] Top-10 CLIP matches:")
-            for idx, score in zip(topk.indices, topk.values):
-                print(f"{self.ingredients[idx]:25s} {score.item():.3f}")
+            for name, score in zip(self._names[indices[0]], scores[0]):
+                print(f"{name:25s} {score:.3f}")
 
-        sims = sims.cpu().numpy()
+        results = self._select(sims)[0]
 
-        results = [
-            (self.ingredients[i], float(sims[i]))
-            for i in range(len(self.ingredients))
-            if sims[i] >= self.sim_threshold
-        ]
+        elapsed_time = time.time() - start_time
+        self.logger.info(f"CLIP detected {len(results)} ingredients in {image_desc} (took {elapsed_time:.2f}s)")
 
-        results.sort(key=lambda x: x[1], reverse=True)
+        return results
 
-        if self.top_k:
-            results = results[:self.top_k]
+    def predict_batch(self, images: List[Union[Path, np.ndarray]]) -> List[List[Tuple[str, float]]]:
+        """predict_detailed for several images, encoded batch_size at a time."""
+        start_time = time.time()
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            results.extend(self._select(self._image_similarities(images[start:start + self.batch_size])))
 
         elapsed_time = time.time() - start_time
-        self.logger.info(f"CLIP detected {len(results)} ingredients in {image_path} (took {elapsed_time:.2f}s)")
-
+        self.logger.info(f"CLIP scored a batch of {len(images)} images (took {elapsed_time:.2f}s)")
         return results
 
-    def predict_folder(self, folder: Path) -> Dict[str, List[str]]:
-        outputs = {}
-        for img in folder.iterdir():
-            if img.suffix.lower() in self.image_exts:
-                outputs[img.name] = self.predict_ingredients(img)
-        return outputs
+    def predict_regions(
+        self,
+        image: Union[Path, np.ndarray],
+        boxes: Optional[Union[np.ndarray, torch.Tensor]] = None,
+    ) -> List[Tuple[str, float]]:
+        """Score candidate regions of one image (xyxy boxes, e.g. from a proposal
+        generator; default: the multi-scale grid) and keep each class's best region."""
+        return self._select(self._region_similarities([image], [boxes]))[0]
+
+    def iter_folder(
+        self,
+        folder: Path,
+        batch_size: Optional[int] = None,
+        num_workers: int = 4,
+    ) -> Iterator[Tuple[str, List[Tuple[str, float]]]]:
+        """Stream (filename, results) for every image in a folder as batches complete.
+
+        Decoding and preprocessing run in DataLoader worker processes while
+        the model encodes the previous batch. Unreadable files yield [].
+        """
+        paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in self.image_exts)
+        loader = DataLoader(
+            _ImageFiles(paths, _to_array if self.mode == "regions" else self.preprocess),
+            batch_size=batch_size or self.batch_size,
+            num_workers=num_workers,
+            collate_fn=_collate,
+            pin_memory=torch.device(self.device).type == "cuda",
+        )
+
+        for batch, indices, readable in loader:
+            if batch is None:
+                selected = iter(())
+            elif self.mode == "regions":
+                selected = iter(self._select(self._region_similarities(batch)))
+            else:
+                selected = iter(self._select(self._similarities(batch)))
+            for i, ok in zip(indices, readable):
+                if not ok:
+                    self.logger.error(f"Could not read image: {paths[i]}")
+                yield paths[i].name, next(selected) if ok else []
+
+    def predict_folder(self, folder: Path, batch_size: Optional[int] = None, num_workers: int = 4) -> Dict[str, List[str]]:
+        return {
+            name: [label for label, _ in results]
+            for name, results in self.iter_folder(folder, batch_size, num_workers)
+        }
 
 
 def main():
@@ -179,6 +415,37 @@ def main():
         default=None,
         help='Device to run on (default: auto)'
     )
+    parser.add_argument(
+        '--precision',
+        choices=PRECISIONS,
+        default='auto',
+        help='Inference precision: fp32, fp16 (CUDA), bf16 autocast or int8 dynamic quantization (CPU) (default: auto = fp32)'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=['image', 'regions'],
+        default='image',
+        help='Score the whole image, or a multi-scale grid of crops with per-class max (default: image)'
+    )
+    parser.add_argument(
+        '--region_scales',
+        type=int,
+        nargs='+',
+        default=[1, 2, 3],
+        help='Grid sizes used in regions mode (default: 1 2 3)'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=32,
+        help='Images encoded per forward pass for directories (default: 32)'
+    )
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=4,
+        help='Background processes decoding and preprocessing images for directories (default: 4)'
+    )
     parser.add_argument(
         '--debug',
         action='store_true',
@@ -200,31 +467,40 @@ def main():
         sim_threshold=args.sim_threshold,
         top_k=args.top_k,
         device=args.device,
+        precision=args.precision,
+        batch_size=args.batch_size,
+        mode=args.mode,
+        region_scales=args.region_scales,
     )
 
-    if args.image.is_dir():
-        exts = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
-        img_paths = sorted(p for p in args.image.iterdir() if p.suffix.lower() in exts)
+    if args.image.is_dir() and not args.debug:
+        # Batched and streamed: results print as each batch finishes
+        print(f'\nRunning on {args.image} in batches of {args.batch_size}...\n')
+        stream = detector.iter_folder(args.image, num_workers=args.num_workers)
     else:
-        img_paths = [args.image]
-
-    print(f'\nRunning on {len(img_paths)} image(s)...\n')
+        if args.image.is_dir():
+            exts = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+            img_paths = sorted(p for p in args.image.iterdir() if p.suffix.lower() in exts)
+        else:
+            img_paths = [args.image]
+        print(f'\nRunning on {len(img_paths)} image(s)...\n')
+        stream = ((path.name, detector.predict_detailed(path, debug=args.debug)) for path in img_paths)
 
     all_results = {}
-    for path in img_paths:
-        t0 = time.time()
-        detections = detector.predict_detailed(path, debug=args.debug)
-        elapsed = time.time() - t0
-
-        print(f'{path.name}  [{elapsed:.1f}s]  {len(detections)} detections')
-        for name, score in detections:
-            print(f'  {name:25s} {score:.3f}')
-
-        all_results[path.name] = [
-            {"class": name, "confidence": round(score, 4)}
-            for name, score in detections
+    t0 = time.time()
+    for name, detections in stream:
+        print(f'{name}  {len(detections)} detections')
+        for label, score in detections:
+            print(f'  {label:25s} {score:.3f}')
+
+        all_results[name] = [
+            {"class": label, "confidence": round(score, 4)}
+            for label, score in detections
         ]
 
+    elapsed = time.time() - t0
+    print(f'\n{len(all_results)} image(s) in {elapsed:.1f}s ({len(all_results) / max(elapsed, 1e-9):.1f} img/s)')
+
     if args.output:
         with open(args.output, 'w') as f:
             json.dump(all_results, f, indent=2)
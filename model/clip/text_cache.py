@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, List, Sequence
+
+import torch
+
+PROMPT_TEMPLATES = [
+    "a photo of {ingredient}",
+    "a close-up photo of {ingredient}",
+    "raw {ingredient} on a plate",
+]
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / ".clip_text_cache"
+
+
+def fingerprint(*parts) -> str:
+    """Short stable hash of JSON-serializable parts."""
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()[:16]
+
+
+@torch.no_grad()
+def encode_classes(
+    model,
+    tokenizer,
+    classes: Sequence[str],
+    templates: Sequence[str],
+    device="cpu",
+    chunk_size: int = 256,
+) -> torch.Tensor:
+    """(len(classes), D) text embeddings: one per template, normalized, averaged, renormalized.
+
+    Prompts are encoded ``chunk_size`` at a time so large vocabularies do not
+    need one giant batch.
+    """
+    prompts = [tmpl.format(ingredient=c) for c in classes for tmpl in templates]
+    chunks = []
+    for start in range(0, len(prompts), chunk_size):
+        tokens = tokenizer(prompts[start:start + chunk_size]).to(device)
+        embeds = model.encode_text(tokens).float()
+        chunks.append(embeds / embeds.norm(dim=-1, keepdim=True))
+
+    text_embeds = torch.cat(chunks).view(len(classes), len(templates), -1).mean(dim=1)
+    return (text_embeds / text_embeds.norm(dim=-1, keepdim=True)).cpu()
+
+
+class TextEmbeddingCache:
+    """On-disk CLIP text embeddings, one file per (model, pretrained, templates) variant.
+
+    Each file maps class names to embeddings, so a changed class list can
+    never be served rows of another list. Classes missing from the file are
+    encoded and added; the rest are reused.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def path_for(self, model_name: str, pretrained: str, templates: Sequence[str]) -> Path:
+        key = fingerprint(model_name, pretrained, list(templates))
+        name = f"{model_name}-{pretrained}".replace("/", "_").replace(":", "_")
+        return self.cache_dir / f"{name}-{key}.pt"
+
+    def _load(self, path: Path) -> dict:
+        if not path.exists():
+            return {}
+        data = torch.load(path, map_location="cpu", weights_only=True)
+        return dict(zip(data["classes"], data["embeds"]))
+
+    def _save(self, path: Path, entries: dict, model_name: str, pretrained: str, templates) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "model_name": model_name,
+            "pretrained": pretrained,
+            "templates": list(templates),
+            "classes": list(entries),
+            "embeds": torch.stack(list(entries.values())),
+        }
+        # Write then rename, so concurrent workers never read a half-written file
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        torch.save(data, tmp)
+        os.replace(tmp, path)
+
+    def get(
+        self,
+        model_name: str,
+        pretrained: str,
+        templates: Sequence[str],
+        classes: Sequence[str],
+        encode: Callable[[List[str]], torch.Tensor],
+    ) -> tuple:
+        """(embeds, n_encoded): (len(classes), D) embeddings in class order and how many had to be encoded.
+
+        ``encode`` turns a list of class names into their embeddings and is
+        only called for classes not cached yet.
+        """
+        path = self.path_for(model_name, pretrained, templates)
+        entries = self._load(path)
+
+        missing = [c for c in dict.fromkeys(classes) if c not in entries]
+        if missing:
+            entries.update(zip(missing, encode(missing)))
+            self._save(path, entries, model_name, pretrained, templates)
+
+        return torch.stack([entries[c] for c in classes]), len(missing)
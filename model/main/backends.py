@@ -0,0 +1,162 @@
+import json
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from model.utils.precision import autocast
+
+EXPORT_NAME = 'arcface_embed'
+BUNDLE_FILE = 'pipeline_bundle.pt'
+BUNDLE_VERSION = 1
+BACKENDS = ('torch', 'onnx', 'torchscript', 'bundle')
+
+
+def artifact_path(model_dir, backend):
+    """Where export.py writes the artifact for a backend."""
+    if backend == 'bundle':
+        return Path(model_dir) / BUNDLE_FILE
+    suffix = {'onnx': '.onnx', 'torchscript': '.torchscript.pt'}[backend]
+    return Path(model_dir) / f'{EXPORT_NAME}{suffix}'
+
+
+def metadata_path(model_dir):
+    return Path(model_dir) / f'{EXPORT_NAME}.json'
+
+
+def read_metadata(model_dir):
+    path = metadata_path(model_dir)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+class EmbedScorer(nn.Module):
+    """The classifier's embed path plus the dense prototype matmul, as one exportable graph.
+
+    Returns (embeddings, sims): L2-normalized (N, D) embeddings and the (N, M)
+    cosine similarities against the prototypes baked in at export time.
+    """
+
+    def __init__(self, classifier, prototypes):
+        super().__init__()
+        self.backbone = classifier.backbone
+        self.register_buffer('prototypes', prototypes.float())
+
+    def forward(self, x):
+        feats = self.backbone.forward_features(x)['x_norm_clstoken']
+        embeddings = nn.functional.normalize(feats, dim=1)
+        return embeddings, torch.mm(embeddings, self.prototypes.T)
+
+
+class BundleScorer(EmbedScorer):
+    """EmbedScorer that also carries the prototype labels, so one archive holds
+    the architecture, weights, prototypes and (as an extra file) class names."""
+
+    def __init__(self, classifier, prototypes, labels):
+        super().__init__(classifier, prototypes)
+        self.register_buffer('labels', labels.long())
+
+
+def save_bundle(scorer, example, class_names, path, **info):
+    """Trace a BundleScorer and save it with its metadata as bundle.json."""
+    meta = {
+        'format_version': BUNDLE_VERSION,
+        'class_names': list(class_names),
+        'num_prototypes': int(scorer.prototypes.shape[0]),
+        'embed_dim': int(scorer.prototypes.shape[1]),
+        **info,
+    }
+    traced = torch.jit.trace(scorer, example, check_trace=False)
+    torch.jit.save(traced, str(path), _extra_files={'bundle.json': json.dumps(meta)})
+
+
+class TorchBackend:
+    """Eager PyTorch: the DINOv2ArcFace module as loaded from arcface_final.pt."""
+
+    name = 'torch'
+    # Whether the sims output can stand in for the index's dense matmul
+    dense_sims = False
+
+    def __init__(self, classifier, precision, device):
+        self.classifier = classifier
+        self.precision = precision
+        self.device = device
+
+    def __call__(self, batch):
+        with autocast(self.precision, self.device):
+            embeddings = self.classifier.embed(batch)
+        return embeddings, None
+
+
+class TorchScriptBackend:
+    """A traced EmbedScorer; loading it needs neither torch.hub nor the DINOv2 source."""
+
+    name = 'torchscript'
+    dense_sims = False
+
+    def __init__(self, path, device, extra_files=()):
+        self.device = device
+        self.extra = dict.fromkeys(extra_files, '')
+        module = torch.jit.load(str(path), map_location=device, _extra_files=self.extra).eval()
+        # Freezing inlines buffers as constants, so keep a handle on them first
+        self.buffers = dict(module.named_buffers())
+        self.module = torch.jit.freeze(module)
+
+    @torch.inference_mode()
+    def __call__(self, batch):
+        return self.module(batch.float())
+
+
+class BundleBackend(TorchScriptBackend):
+    """A pipeline_bundle.pt from export.py: classifier, prototypes, labels and class names in one file."""
+
+    name = 'bundle'
+
+    def __init__(self, path, device):
+        super().__init__(path, device, extra_files=('bundle.json',))
+        self.meta = json.loads(self.extra['bundle.json'])
+        if self.meta.get('format_version') != BUNDLE_VERSION:
+            raise ValueError(
+                f"{Path(path).name} has bundle format {self.meta.get('format_version')}, "
+                f"expected {BUNDLE_VERSION}; re-export it"
+            )
+        self.class_names = self.meta['class_names']
+        self.prototypes = self.buffers['prototypes'].cpu()
+        self.labels = self.buffers['labels'].cpu()
+
+
+class OnnxBackend:
+    """An exported EmbedScorer run by ONNX Runtime with full graph optimizations."""
+
+    name = 'onnx'
+    dense_sims = False
+
+    def __init__(self, path, device, threads=0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "The onnx backend needs onnxruntime: pip install -r model/requirements-export.txt"
+            ) from e
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+
+        providers = ['CPUExecutionProvider']
+        if device.type == 'cuda' and 'CUDAExecutionProvider' in ort.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+
+        self.device = device
+        self.session = ort.InferenceSession(str(path), sess_options=opts, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = {self.input_name: batch.float().cpu().numpy()}
+        embeddings, sims = self.session.run(None, inputs)
+        return (
+            torch.from_numpy(embeddings).to(self.device),
+            torch.from_numpy(sims).to(self.device),
+        )
@@ -0,0 +1,150 @@
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import torch
+
+from model.main.detect import MODEL_DIR, Pipeline
+from model.utils.benchmark import (bench_variants, load_named_images,
+                                   print_variant_report)
+
+
+def _load_images(path: Path, limit: int):
+    return [img for _, img in load_named_images(path, limit)]
+
+
+def _sync(pipeline):
+    if pipeline.device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def _time_per_image(fn, images, runs, pipeline):
+    """Median seconds per image of fn(img) over several passes, after one warm-up."""
+    fn(images[0])
+    samples = []
+    for _ in range(runs):
+        for img in images:
+            _sync(pipeline)
+            t0 = time.perf_counter()
+            fn(img)
+            _sync(pipeline)
+            samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def bench_text_cache(pipeline, images, runs):
+    print('Grounding DINO proposal stage, per image:')
+    timings = {}
+    for enabled in (False, True):
+        pipeline.cache_text = enabled
+        timings[enabled] = _time_per_image(lambda img: pipeline._propose([img]), images, runs, pipeline)
+        print(f'  text cache {"on " if enabled else "off"}: {timings[enabled] * 1000:8.1f} ms')
+    pipeline.cache_text = True
+
+    saved = timings[False] - timings[True]
+    print(f'  saving:        {saved * 1000:8.1f} ms/image ({saved / timings[False]:.1%})')
+
+
+def bench_precision(named_images, runs, model_dir, device, precisions, labels=None):
+    """Build one pipeline per precision and compare latency and detected classes.
+
+    Accuracy is the mean per-image F1 of the detected class set against
+    ``labels`` ({filename: [classes]}) when given, else against fp32.
+    """
+    latencies, outputs = bench_variants(
+        precisions,
+        build=lambda precision: Pipeline(model_dir=model_dir, device=device, precision=precision),
+        predict=lambda pipeline, img: pipeline.predict(img),
+        classes=Pipeline._class_names,
+        named_images=named_images,
+        runs=runs,
+        sync=_sync,
+    )
+    print_variant_report('Full pipeline, per image:', named_images, latencies, outputs, labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark stages of the main detection pipeline')
+
+    parser.add_argument(
+        '--mode',
+        choices=['text_cache', 'precision'],
+        default='text_cache',
+        help='What to benchmark (default: text_cache)'
+    )
+    parser.add_argument(
+        '--image',
+        required=True,
+        type=Path,
+        help='Image file or directory of images'
+    )
+    parser.add_argument(
+        '--model_dir',
+        type=Path,
+        default=MODEL_DIR,
+        help='Folder containing the classifier assets (default: model/main/assets)'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='Maximum number of images to use (default: 20)'
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='Timed passes over the image set (default: 3)'
+    )
+    parser.add_argument(
+        '--device',
+        default=None,
+        help="Device for running the pipeline ('cuda' or 'cpu', default: auto)"
+    )
+    parser.add_argument(
+        '--precisions',
+        nargs='+',
+        default=None,
+        help='Precisions compared in precision mode (default: fp32 bf16 int8 on CPU, fp32 fp16 bf16 on CUDA)'
+    )
+    parser.add_argument(
+        '--labels',
+        type=Path,
+        default=None,
+        help='JSON {filename: [classes]} for the held-out set; without it, precision mode scores against fp32'
+    )
+
+    args = parser.parse_args()
+
+    if args.mode == 'precision':
+        named_images = load_named_images(args.image, args.limit)
+        if not named_images:
+            raise SystemExit(f'No readable images in {args.image}')
+
+        device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        precisions = args.precisions or (
+            ['fp32', 'fp16', 'bf16'] if device.startswith('cuda') else ['fp32', 'bf16', 'int8']
+        )
+        if args.labels is None and 'fp32' not in precisions:
+            precisions = ['fp32'] + precisions
+        labels = json.loads(args.labels.read_text()) if args.labels else None
+
+        print(f'\nBenchmarking {precisions} on {len(named_images)} image(s), {args.runs} run(s), device {device}\n')
+        bench_precision(named_images, args.runs, args.model_dir, device, precisions, labels)
+        return
+
+    images = _load_images(args.image, args.limit)
+    if not images:
+        raise SystemExit(f'No readable images in {args.image}')
+
+    pipeline = Pipeline(model_dir=args.model_dir, device=args.device)
+    print(f'\nBenchmarking on {len(images)} image(s), {args.runs} run(s), device {pipeline.device}\n')
+
+    if args.mode == 'text_cache':
+        bench_text_cache(pipeline, images, args.runs)
+
+
+if __name__ == '__main__':
+    main()
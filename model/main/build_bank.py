@@ -0,0 +1,121 @@
+import argparse
+from pathlib import Path
+
+import torch
+
+from model.main.detect import (CLASSIFY_TRANSFORM, MODEL_DIR, batched,
+                               extract_crop, load_class_names, load_classifier,
+                               load_rgb)
+from model.main.index import load_prototypes, spherical_kmeans
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def _crop_tensor(path: Path):
+    img = load_rgb(path)
+    if img is None:
+        return None
+    H, W = img.shape[:2]
+    # Letterbox the whole crop the same way Pipeline squares its proposals
+    sq = extract_crop(img, (0, 0, W, H), pad=0)
+    return None if sq is None else CLASSIFY_TRANSFORM(sq)
+
+
+def embed_folder(classifier, folder: Path, device, batch_size=32):
+    """L2-normalized embeddings of every readable image in folder, as float32 on CPU."""
+    paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_EXTS)
+    chunks = []
+    for chunk in batched(paths, batch_size):
+        tensors = [t for t in (_crop_tensor(p) for p in chunk) if t is not None]
+        if not tensors:
+            continue
+        batch = torch.stack(tensors).to(device, next(classifier.parameters()).dtype)
+        chunks.append(classifier.embed(batch).float().cpu())
+    return torch.cat(chunks) if chunks else torch.empty(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build a multi-prototype bank by clustering classifier embeddings of labelled crops'
+    )
+
+    parser.add_argument(
+        '--crops',
+        required=True,
+        type=Path,
+        help='Folder with one sub-folder of crop images per class, named as in data.yaml'
+    )
+    parser.add_argument(
+        '--model_dir',
+        type=Path,
+        default=MODEL_DIR,
+        help='Folder containing arcface_final.pt, prototypes.pt, data.yaml (default: model/main/assets)'
+    )
+    parser.add_argument(
+        '--per_class',
+        type=int,
+        default=4,
+        help='Prototypes kept per class; classes with fewer crops keep one per crop (default: 4)'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=32,
+        help='Crops embedded per forward pass (default: 32)'
+    )
+    parser.add_argument(
+        '--device',
+        default=None,
+        help="Device for the classifier ('cuda' or 'cpu', default: auto)"
+    )
+    parser.add_argument(
+        '--output',
+        type=Path,
+        default=None,
+        help='Output path (default: <model_dir>/prototypes_bank.pt)'
+    )
+
+    args = parser.parse_args()
+
+    device = torch.device(args.device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+    proto_path = args.model_dir / 'prototypes.pt'
+    class_names = load_class_names(args.model_dir, proto_path)
+    base_vectors, base_labels = load_prototypes(proto_path)
+
+    classifier = load_classifier(args.model_dir / 'arcface_final.pt', len(class_names), device)
+
+    vectors, labels = [], []
+    missing = []
+    for class_idx, name in enumerate(class_names):
+        folder = args.crops / name
+        emb = embed_folder(classifier, folder, device, args.batch_size) if folder.is_dir() else torch.empty(0)
+
+        if len(emb) == 0:
+            # No crops for this class: keep whatever prototypes.pt already had
+            keep = base_labels == class_idx
+            vectors.append(base_vectors[keep].float())
+            labels.append(base_labels[keep])
+            missing.append(name)
+            continue
+
+        centroids, _ = spherical_kmeans(emb, args.per_class)
+        vectors.append(centroids)
+        labels.append(torch.full((len(centroids),), class_idx, dtype=torch.long))
+        print(f'  {name}: {len(emb)} crops -> {len(centroids)} prototypes')
+
+    bank = {
+        'prototypes': torch.cat(vectors),
+        'labels': torch.cat(labels),
+        'class_names': list(class_names),
+    }
+
+    if missing:
+        print(f'{len(missing)} class(es) had no crops and kept their original prototype: {missing}')
+
+    out_path = args.output or args.model_dir / 'prototypes_bank.pt'
+    torch.save(bank, out_path)
+    print(f'Saved {len(bank["labels"])} prototypes for {len(class_names)} classes: {out_path}')
+
+
+if __name__ == '__main__':
+    main()
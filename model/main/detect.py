@@ -7,9 +7,6 @@ from pathlib import Path
 from typing import Dict, List, Optional
 
 import cv2
-import matplotlib
-import matplotlib.patches as patches
-import matplotlib.pyplot as plt
 import numpy as np
 import torch
 import torch.nn as nn
@@ -17,10 +14,22 @@ import torch.nn.functional as F
 import torchvision.transforms as T
 import yaml
 from PIL import Image
+from torchvision.ops import batched_nms
 from transformers import (GroundingDinoForObjectDetection,
                           GroundingDinoProcessor)
-
+from transformers.modeling_outputs import \
+    BaseModelOutputWithPoolingAndCrossAttentions
+
+from model.main.backends import (BACKENDS, BundleBackend, OnnxBackend,
+                                 TorchBackend, TorchScriptBackend,
+                                 artifact_path, read_metadata)
+from model.main.index import (FlatIndex, IVFIndex, file_hash, index_path_for,
+                              load_index, load_prototypes)
 from model.utils.logger import setup_logger
+from model.utils.precision import (PRECISIONS, autocast, quantize_linear,
+                                   resolve_precision)
+from model.utils.tiling import shift_boxes, slice_image
+from model.utils.timing import StageTimer
 
 MODEL_DIR = Path(__file__).resolve().parent / "assets"
 
@@ -65,11 +74,54 @@ class DINOv2ArcFace(nn.Module):
         return F.normalize(feats, dim=1)
 
 
+class CachedTextBackbone(nn.Module):
+    """Memoizes Grounding DINO's BERT text branch for a fixed prompt.
+
+    The pipeline always sends the same tokenized prompt, so the text
+    features are computed once and expanded across the image batch on
+    later calls. Any other input falls through to the wrapped backbone.
+    """
+
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+        self.enabled = True
+        self._input_ids = None
+        self._hidden = None
+
+    def clear(self):
+        self._input_ids = None
+        self._hidden = None
+
+    def forward(self, input_ids, *args, **kwargs):
+        if not self.enabled:
+            return self.backbone(input_ids, *args, **kwargs)
+
+        if (
+            self._hidden is not None
+            and self._input_ids.shape[-1] == input_ids.shape[-1]
+            and torch.equal(input_ids, self._input_ids.expand_as(input_ids))
+        ):
+            hidden = self._hidden.expand(input_ids.shape[0], -1, -1)
+            return BaseModelOutputWithPoolingAndCrossAttentions(last_hidden_state=hidden)
+
+        outputs = self.backbone(input_ids, *args, **kwargs)
+        # Only memoize a batch that is one prompt repeated
+        if torch.equal(input_ids, input_ids[:1].expand_as(input_ids)):
+            self._input_ids = input_ids[:1].clone()
+            self._hidden = outputs[0][:1].detach()
+        return outputs
+
+
+CLASSIFY_SIZE = 224
+CLASSIFY_MEAN = (0.485, 0.456, 0.406)
+CLASSIFY_STD = (0.229, 0.224, 0.225)
+
 CLASSIFY_TRANSFORM = T.Compose([
     T.ToPILImage(),
-    T.Resize((224, 224)),
+    T.Resize((CLASSIFY_SIZE, CLASSIFY_SIZE)),
     T.ToTensor(),
-    T.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+    T.Normalize(mean=CLASSIFY_MEAN, std=CLASSIFY_STD),
 ])
 
 
@@ -99,7 +151,112 @@ def extract_crop(img_rgb, xyxy, pad=0.05):
     return cv2.resize(sq, (224, 224))
 
 
+def load_class_names(model_dir, proto_path):
+    """Class names from data.yaml, falling back to the prototype file."""
+    yaml_path = model_dir / 'data.yaml'
+    if yaml_path.exists():
+        with open(yaml_path) as f:
+            return yaml.safe_load(f)['names']
+
+    proto_data = torch.load(proto_path, map_location='cpu')
+    if 'class_names' in proto_data:
+        return proto_data['class_names']
+    raise FileNotFoundError(
+        f'data.yaml not found in {model_dir} and {proto_path.name} has no class_names.'
+    )
+
+
+def load_classifier(weights_path, num_classes, device):
+    ckpt = torch.load(weights_path, map_location=device)
+    classifier = DINOv2ArcFace(num_classes=num_classes).to(device)
+    classifier.load_state_dict(ckpt['model_state'])
+    return classifier.eval()
+
+
+def load_rgb(path: Path) -> Optional[np.ndarray]:
+    img_bgr = cv2.imread(str(path))
+    if img_bgr is None:
+        return None
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+
+
+def batched(items, size):
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def image_to_tensor(img_rgb, device):
+    """HWC uint8 RGB array -> CHW float tensor in [0, 1] on device (copies uint8, converts there)."""
+    img = torch.from_numpy(np.ascontiguousarray(img_rgb)).to(device, non_blocking=True)
+    return img.permute(2, 0, 1).float().div_(255)
+
+
+def extract_crops(img, boxes, pad=0.05, size=CLASSIFY_SIZE):
+    """Batched extract_crop + CLASSIFY_TRANSFORM for every box at once.
+
+    img is a (3, H, W) float tensor in [0, 1] and boxes an (N, 4) xyxy
+    tensor on the same device. Each box is padded, clipped to the image,
+    letterboxed into a black square and bilinearly resized in a single
+    grid_sample call. Returns normalized (M, 3, size, size) crops and the
+    (N,) mask of boxes that produced one (M = mask.sum()).
+    """
+    _, H, W = img.shape
+    x1, y1, x2, y2 = boxes.float().unbind(1)
+    bw, bh = x2 - x1, y2 - y1
+    keep = (bw >= 2) & (bh >= 2)
+
+    # Padded window clipped to the image, truncated to whole pixels like the slicing in extract_crop
+    cx1 = (x1 - bw * pad).clamp(min=0).floor()
+    cy1 = (y1 - bh * pad).clamp(min=0).floor()
+    cx2 = (x2 + bw * pad).clamp(max=W).floor()
+    cy2 = (y2 + bh * pad).clamp(max=H).floor()
+    keep &= (cx2 > cx1) & (cy2 > cy1)
+
+    idx = keep.nonzero().squeeze(1)
+    if idx.numel() == 0:
+        return img.new_zeros((0, 3, size, size)), keep
+    cx1, cy1, cx2, cy2 = cx1[idx], cy1[idx], cx2[idx], cy2[idx]
+
+    # Centre each crop in a side x side square
+    cw, ch = cx2 - cx1, cy2 - cy1
+    side = torch.maximum(cw, ch)
+    ox = cx1 - torch.div(side - cw, 2, rounding_mode='floor')
+    oy = cy1 - torch.div(side - ch, 2, rounding_mode='floor')
+
+    # Output pixel centres in image pixel coordinates, (M, size) per axis
+    t = (torch.arange(size, device=img.device, dtype=torch.float32) + 0.5) / size
+    xs = ox[:, None] + t[None, :] * side[:, None] - 0.5
+    ys = oy[:, None] + t[None, :] * side[:, None] - 0.5
+
+    grid = torch.stack(torch.broadcast_tensors(
+        ((2 * xs + 1) / W - 1)[:, None, :],
+        ((2 * ys + 1) / H - 1)[:, :, None],
+    ), dim=-1)
+
+    # One sampling call over all crops stacked along the height axis
+    M = idx.numel()
+    crops = F.grid_sample(
+        img[None], grid.reshape(1, M * size, size, 2),
+        mode='bilinear', padding_mode='zeros', align_corners=False,
+    ).reshape(3, M, size, size).transpose(0, 1)
+
+    # Letterbox: black outside the crop window, not the neighbouring image content
+    inside_x = (xs >= cx1[:, None] - 0.5) & (xs <= cx2[:, None] - 0.5)
+    inside_y = (ys >= cy1[:, None] - 0.5) & (ys <= cy2[:, None] - 0.5)
+    crops = crops * (inside_y[:, :, None] & inside_x[:, None, :])[:, None]
+
+    mean = torch.tensor(CLASSIFY_MEAN, device=img.device)[None, :, None, None]
+    std = torch.tensor(CLASSIFY_STD, device=img.device)[None, :, None, None]
+    return (crops - mean) / std, keep
+
+
 def visualise_and_save(img_rgb, detections, out_path):
+    # Only the CLI draws, so keep matplotlib off the service's import path
+    import matplotlib
+    import matplotlib.patches as patches
+    import matplotlib.pyplot as plt
+
     matplotlib.use('Agg')
 
     fig, ax = plt.subplots(figsize=(12, 9))
@@ -140,156 +297,438 @@ class Pipeline:
             gd_model_id='IDEA-Research/grounding-dino-tiny',
             gd_prompt='food ingredient .',
             gd_threshold=0.1,
-            device=None
+            device=None,
+            cache_text=True,
+            nms_iou=0.5,
+            max_proposals=50,
+            min_box_area=64.0,
+            class_merge_iou=None,
+            index='auto',
+            nprobe=None,
+            prototypes_file='prototypes.pt',
+            vote='max',
+            knn_k=10,
+            knn_temperature=0.05,
+            precision='auto',
+            backend='torch',
+            backend_threads=0,
+            tile_size=None,
+            tile_overlap=0.2,
+            tile_batch_size=8,
         ):
         device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
         self.device = torch.device(device)
+        # fp16 halves the classifier on CUDA; bf16 autocasts both models; int8 quantizes their linear layers (CPU)
+        self.precision = resolve_precision(
+            precision, self.device, auto='fp16' if self.device.type == 'cuda' else 'fp32'
+        )
+        self._text_backbone = None
         self.gd_prompt = gd_prompt
         self.gd_threshold = gd_threshold
+        # Proposal filtering before cropping (nms_iou >= 1 disables NMS, max_proposals <= 0 disables the cap)
+        self.nms_iou = nms_iou
+        self.max_proposals = max_proposals
+        self.min_box_area = min_box_area
+        # Optional same-class box merge after classification (None disables)
+        self.class_merge_iou = class_merge_iou
+        # How a bank with several prototypes per class turns into class scores:
+        # 'max' takes each class's best prototype, 'knn' lets the knn_k nearest vote
+        assert vote in ('max', 'knn'), f"vote must be 'max' or 'knn', got {vote!r}"
+        self.vote = vote
+        self.knn_k = knn_k
+        self.knn_temperature = knn_temperature
+        # Sliced proposals for high-res images: Grounding DINO sees overlapping tiles (None disables)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # Tiles per Grounding DINO pass: a coalesced batch of large images can hold
+        # hundreds of tiles, far too many padded inputs for one forward pass
+        self.tile_batch_size = max(1, tile_batch_size)
         self.logger = setup_logger(__name__, "main_pipeline.log")
+        timer = StageTimer()
 
-        yaml_path = model_dir / 'data.yaml'
-        proto_path = model_dir / 'prototypes.pt'
+        proto_path = model_dir / prototypes_file
         weights_path = model_dir / 'arcface_final.pt'
 
-        assert weights_path.exists(), f'arcface_final.pt not found in {model_dir}'
-        assert proto_path.exists(), f'prototypes.pt not found in {model_dir}'
-
-        if yaml_path.exists():
-            with open(yaml_path) as f:
-                self.class_names = yaml.safe_load(f)['names']
+        assert backend in BACKENDS, f'backend must be one of {BACKENDS}, got {backend!r}'
+        if backend == 'bundle':
+            # Everything the classifier needs comes from the one file, no torch.hub
+            bundle_path = artifact_path(model_dir, 'bundle')
+            assert bundle_path.exists(), f'{bundle_path.name} not found in {model_dir}; run model/main/export.py --format bundle'
+            with timer.stage('classifier'):
+                self.logger.info(f'Loading bundle: {bundle_path.name} ...')
+                bundle = BundleBackend(bundle_path, self.device)
+                self.classifier = None
+            self.class_names = bundle.class_names
         else:
-            proto_data = torch.load(
-                proto_path,
-                map_location='cpu'
-            )
-
-            if 'class_names' in proto_data:
-                self.class_names = proto_data['class_names']
-            else:
-                raise FileNotFoundError(
-                    f'data.yaml not found in {model_dir} and prototypes.pt has no class_names.'
-                )
-
+            if backend == 'torch':
+                assert weights_path.exists(), f'arcface_final.pt not found in {model_dir}'
+            assert proto_path.exists(), f'{prototypes_file} not found in {model_dir}'
+            with timer.stage('class_names'):
+                self.class_names = load_class_names(model_dir, proto_path)
         num_classes = len(self.class_names)
 
-
         local_gd_path = Path(__file__).resolve().parent / 'assets' / 'grounding-dino-tiny'
 
         gd_source = str(local_gd_path) if local_gd_path.exists() else gd_model_id
 
-        self.logger.info(f'Loading Grounding DINO: {gd_source} ...')
-        self.gd_processor = GroundingDinoProcessor.from_pretrained(gd_source)
-
-        self.gd_model = GroundingDinoForObjectDetection.from_pretrained(
-            gd_source
-        ).to(self.device)
-        self.gd_model.eval()
-
-        self.logger.info(f'Loading classifier ({num_classes} classes) ...')
-        ckpt = torch.load(weights_path, map_location=self.device)
-
-        self.classifier = DINOv2ArcFace(num_classes=num_classes).to(self.device)
-        self.classifier.load_state_dict(ckpt['model_state'])
-        self.classifier.eval()
-
-        proto_data = torch.load(proto_path, map_location=self.device)
-        # Pre-transpose prototypes — they never change, saves a transpose every call
-        self.prototypes_T = proto_data['prototypes'].to(self.device).T
+        with timer.stage('grounding_dino'):
+            self.logger.info(f'Loading Grounding DINO: {gd_source} ...')
+            self.gd_processor = GroundingDinoProcessor.from_pretrained(gd_source)
+
+            self.gd_model = GroundingDinoForObjectDetection.from_pretrained(
+                gd_source
+            ).to(self.device)
+            self.gd_model.eval()
+
+        # The prompt is fixed, so its BERT features are reused across calls
+        self._text_backbone = CachedTextBackbone(self.gd_model.model.text_backbone)
+        self._text_backbone.enabled = cache_text
+        self.gd_model.model.text_backbone = self._text_backbone
+
+        if backend == 'bundle':
+            with timer.stage('index'):
+                self.index = self._bundle_index(bundle, index, nprobe)
+            bundle.dense_sims = self.index.kind == 'flat'
+            self.backend = bundle
+        else:
+            with timer.stage('index'):
+                self.index = self._load_index(model_dir, proto_path, index, nprobe)
+            with timer.stage('classifier'):
+                self.backend = self._load_backend(
+                    model_dir, backend, backend_threads, weights_path, prototypes_file, num_classes
+                )
 
-        # Use float16 on CUDA for faster embedding + similarity matmul
-        if self.device.type == 'cuda':
+        if self.precision == 'fp16' and backend == 'torch':
+            # float16 classifier for faster embedding + similarity matmul
             self.classifier.half()
-            self.prototypes_T = self.prototypes_T.half()
+            self.index.to(self.device, torch.float16)
+        else:
+            self.index.to(self.device)
+
+        if self.precision == 'int8':
+            with timer.stage('quantize'):
+                quantize_linear(self.gd_model)
+                if backend == 'torch':
+                    quantize_linear(self.classifier)
+
+        self.startup_timings = timer.stages
+        self.logger.info(f'Pipeline ready.  Device: {self.device}, precision: {self.precision}')
+        self.logger.info(f'Startup: {timer.summary()}')
+
+    def _load_backend(self, model_dir, backend, threads, weights_path, prototypes_file, num_classes):
+        """Classifier runtime: eager DINOv2ArcFace, or an artifact from export.py."""
+        if backend == 'torch':
+            self.logger.info(f'Loading classifier ({num_classes} classes) ...')
+            self.classifier = load_classifier(weights_path, num_classes, self.device)
+            return TorchBackend(self.classifier, self.precision, self.device)
+
+        path = artifact_path(model_dir, backend)
+        assert path.exists(), f'{path.name} not found in {model_dir}; run model/main/export.py first'
+        self.classifier = None
+        self.logger.info(f'Loading {backend} classifier: {path.name} ...')
+        runtime = (
+            OnnxBackend(path, self.device, threads) if backend == 'onnx'
+            else TorchScriptBackend(path, self.device)
+        )
+
+        meta = read_metadata(model_dir)
+        # Embeddings from older weights do not live in the same space as the current prototypes
+        if weights_path.exists() and meta.get('weights_hash') != file_hash(weights_path):
+            raise ValueError(
+                f'{path.name} was not exported from the current {weights_path.name}; '
+                f're-run model/main/export.py'
+            )
 
-        self.logger.info(f'Pipeline ready.  Device: {self.device}')
+        # The exported matmul is only usable if it was baked from the same prototypes
+        matches = (
+            meta.get('prototypes_file') == prototypes_file
+            and meta.get('prototypes_hash') == file_hash(model_dir / prototypes_file)
+            and meta.get('num_prototypes') == len(self.index)
+        )
+        if not matches:
+            self.logger.warning(f'{path.name} was exported for other prototypes; using its embeddings only')
+        runtime.dense_sims = matches and self.index.kind == 'flat'
+        return runtime
+
+    def _bundle_index(self, bundle, kind, nprobe):
+        """Search index over the prototypes stored in a bundle (built in memory for ivf)."""
+        if kind == 'ivf':
+            return IVFIndex.build(bundle.prototypes, bundle.labels, nprobe=nprobe or 8)
+        return FlatIndex(bundle.prototypes, bundle.labels)
+
+    def _load_index(self, model_dir, proto_path, kind, nprobe):
+        """Prototype search index: a persisted one from index.py if present, else exact flat search."""
+        index_path = index_path_for(proto_path)
+        if kind in ('auto', 'ivf') and index_path.exists():
+            index = load_index(index_path, nprobe=nprobe)
+            if index.source_hash != file_hash(proto_path):
+                # Stale vectors or labels would silently give wrong (or out-of-range) classes
+                self.logger.warning(
+                    f'{index_path.name} was not built from the current {proto_path.name}; '
+                    f'ignoring it (rebuild with model/main/index.py)'
+                )
+            elif kind == 'auto' or index.kind == 'ivf':
+                self.logger.info(f'Loaded {index.kind} prototype index ({len(index)} prototypes)')
+                return index
+
+        vectors, labels = load_prototypes(proto_path)
+        if kind == 'ivf':
+            self.logger.warning(f'No usable IVF index in {model_dir}, building one in memory')
+            return IVFIndex.build(vectors, labels, nprobe=nprobe or 8)
+        return FlatIndex(vectors, labels)
+
+    @property
+    def gd_prompt(self):
+        return self._gd_prompt
+
+    @gd_prompt.setter
+    def gd_prompt(self, prompt):
+        self._gd_prompt = prompt
+        # Re-tokenize and re-encode lazily on the next call
+        self._text_inputs = None
+        if self._text_backbone is not None:
+            self._text_backbone.clear()
+
+    @property
+    def cache_text(self):
+        return self._text_backbone.enabled
+
+    @cache_text.setter
+    def cache_text(self, enabled):
+        self._text_backbone.enabled = enabled
+        self._text_backbone.clear()
+
+    def _prompt_inputs(self):
+        """Tokenized prompt, built once and kept on the device."""
+        if self._text_inputs is None:
+            tokens = self.gd_processor.tokenizer(self.gd_prompt, return_tensors='pt')
+            self._text_inputs = {k: v.to(self.device) for k, v in tokens.items()}
+        return self._text_inputs
 
     @torch.inference_mode()
-    def predict(self, img_rgb, top_k=1):
-        H, W = img_rgb.shape[:2]
-        pil_img = Image.fromarray(img_rgb)
+    def _propose(self, images):
+        """Run Grounding DINO on a list of RGB images in a single forward pass."""
+        pil_imgs = [Image.fromarray(img) for img in images]
 
-        inputs = self.gd_processor(
-            images=pil_img,
-            text=self.gd_prompt,
+        # The image processor pads the batch to a common size and emits a pixel mask
+        inputs = self.gd_processor.image_processor(
+            images=pil_imgs,
             return_tensors='pt',
         ).to(self.device)
+        text_inputs = {
+            k: v.expand(len(pil_imgs), -1)
+            for k, v in self._prompt_inputs().items()
+        }
 
-        outputs = self.gd_model(**inputs)
+        with autocast(self.precision, self.device):
+            outputs = self.gd_model(**inputs, **text_inputs)
         results = self.gd_processor.post_process_grounded_object_detection(
             outputs,
-            inputs.input_ids,
+            text_inputs['input_ids'],
             threshold=self.gd_threshold,
-            target_sizes=[(H, W)],
-        )[0]
+            target_sizes=[img.shape[:2] for img in images],
+        )
 
-        proposal_boxes = results['boxes'].cpu().tolist()
-        if not proposal_boxes:
-            return []
+        return [(r['boxes'].float(), r['scores'].float()) for r in results]
+
+    def _propose_tiled(self, images):
+        """Grounding DINO over overlapping tiles of every image, tile_batch_size tiles per pass.
+
+        Tile boxes are mapped back to full-image coordinates and duplicates
+        across tiles are left to the NMS in _filter_proposals. Crops are then
+        cut from the full-resolution image, so small objects keep their pixels.
+        """
+        tiles, owners, offsets = [], [], []
+        for i, img in enumerate(images):
+            img_tiles, img_offsets = slice_image(img, self.tile_size, self.tile_overlap)
+            tiles += img_tiles
+            offsets += img_offsets
+            owners += [i] * len(img_tiles)
+
+        proposals = [p for chunk in batched(tiles, self.tile_batch_size) for p in self._propose(chunk)]
+        per_image = [([], []) for _ in images]
+        for (boxes, scores), owner, offset in zip(proposals, owners, offsets):
+            per_image[owner][0].append(shift_boxes(boxes, offset))
+            per_image[owner][1].append(scores)
+        return [(torch.cat(boxes), torch.cat(scores)) for boxes, scores in per_image]
+
+    def _filter_proposals(self, proposals):
+        """Drop tiny boxes, suppress overlapping ones and cap the count, for all images at once.
+
+        batched_nms groups by image index, so boxes from different images never
+        suppress each other. Returns one box tensor per image, highest score first.
+        """
+        boxes = torch.cat([b for b, _ in proposals])
+        scores = torch.cat([s for _, s in proposals])
+        image_ids = torch.cat([
+            torch.full((len(b),), i, dtype=torch.long, device=b.device)
+            for i, (b, _) in enumerate(proposals)
+        ])
+
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        idx = (areas >= self.min_box_area).nonzero().squeeze(1)
+
+        if self.nms_iou < 1:
+            idx = idx[batched_nms(boxes[idx], scores[idx], image_ids[idx], self.nms_iou)]
+        else:
+            idx = idx[scores[idx].argsort(descending=True)]
+
+        filtered = []
+        for i in range(len(proposals)):
+            sel = idx[image_ids[idx] == i]
+            if self.max_proposals > 0:
+                sel = sel[:self.max_proposals]
+            filtered.append(boxes[sel])
+        return filtered
+
+    def _merge_same_class(self, boxes, owners, top_probs, top_idx):
+        """Keep the most confident of overlapping boxes that got the same top-1 class."""
+        groups = owners * len(self.class_names) + top_idx[:, 0]
+        keep = batched_nms(boxes.float(), top_probs[:, 0], groups, self.class_merge_iou)
+        return keep.sort().values
+
+    def _classify(self, batch, top_k):
+        """Embed crops and return their top-k class probabilities and class indices."""
+        embeddings, sims = self.backend(batch)
+        embeddings = embeddings.to(self.index.vectors.dtype)
+        if not self.backend.dense_sims:
+            sims = None
+        num_classes = len(self.class_names)
 
-        # Collect valid crops and their corresponding boxes
-        crop_tensors = []
-        valid_boxes = []
-        for box in proposal_boxes:
-            crop = extract_crop(img_rgb, box)
-            if crop is None:
-                continue
-            crop_tensors.append(CLASSIFY_TRANSFORM(crop))
-            valid_boxes.append(box)
+        if self.vote == 'knn':
+            scores, ids, _ = self.index.search(embeddings, self.knn_k)
+            weights = torch.softmax(scores / self.knn_temperature, dim=1)
+            probs = weights.new_zeros((weights.shape[0], num_classes))
+            probs.scatter_add_(1, self.index.labels[ids], weights)
+        else:
+            # Dense matmul + segmented max; a plain matmul for one prototype per class
+            probs = torch.softmax(self.index.class_scores(embeddings, num_classes, sims=sims), dim=1)
 
-        if not crop_tensors:
-            return []
+        return probs.topk(min(top_k, num_classes), dim=1)
 
-        # Batch classify all crops in a single forward pass
-        batch = torch.stack(crop_tensors).to(self.device)
-        if self.device.type == 'cuda':
-            batch = batch.half()
-        embeddings = self.classifier.embed(batch)
-        all_sims = torch.mm(embeddings, self.prototypes_T).float()
-        del batch, embeddings
+    def _build_detections(self, top_probs, top_idx, boxes, owners, top_k, num_images):
+        """Turn batched top-k results into per-image detection dicts.
+
+        Boxes, scores and indices come back to the host in a single transfer.
+        """
+        k = top_probs.shape[1]
+
+        if self.class_merge_iou is not None:
+            keep = self._merge_same_class(boxes, owners, top_probs, top_idx)
+            boxes, owners, top_probs, top_idx = boxes[keep], owners[keep], top_probs[keep], top_idx[keep]
 
-        detections = []
-        for sims, box in zip(all_sims, valid_boxes):
+        rows = torch.cat([boxes.float(), top_probs, top_idx.float(), owners[:, None].float()], dim=1)
+        rows = rows.cpu().tolist()
+
+        detections = [[] for _ in range(num_images)]
+        for row in rows:
+            owner = int(row[-1])
+            box = [round(v, 1) for v in row[:4]]
+            probs, idx = row[4:4 + k], row[4 + k:4 + 2 * k]
             if top_k == 1:
-                pred_idx = sims.argmax().item()
-                confidence = torch.softmax(sims, dim=0)[pred_idx].item()
-                detections.append({
-                    'class': self.class_names[pred_idx],
-                    'confidence': round(confidence, 4),
-                    'box': [round(v, 1) for v in box],
+                detections[owner].append({
+                    'class': self.class_names[int(idx[0])],
+                    'confidence': round(probs[0], 4),
+                    'box': box,
                 })
             else:
-                topk = sims.topk(min(top_k, len(self.class_names)))
-                probs = torch.softmax(sims, dim=0)
-                detections.append({
+                detections[owner].append({
                     'predictions': [
-                        {'class': self.class_names[i.item()],
-                         'confidence': round(probs[i].item(), 4)}
-                        for i in topk.indices
+                        {'class': self.class_names[int(i)], 'confidence': round(p, 4)}
+                        for i, p in zip(idx, probs)
                     ],
-                    'box': [round(v, 1) for v in box],
+                    'box': box,
                 })
-
         return detections
 
-    def predict_ingredients(self, image_path: Path) -> List[str]:
-        img_bgr = cv2.imread(str(image_path))
-        if img_bgr is None:
-            self.logger.error(f"Could not read image: {image_path}")
+    @torch.inference_mode()
+    def predict_batch(self, images, top_k=1):
+        """Detect ingredients in several RGB images at once.
+
+        All images share one Grounding DINO pass, and the crops from every
+        image share one classifier pass. Returns one detection list per image.
+        """
+        if not images:
             return []
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-        detections = self.predict(img_rgb)
+
+        if self.tile_size:
+            proposals = self._filter_proposals(self._propose_tiled(images))
+        else:
+            proposals = self._filter_proposals(self._propose(images))
+
+        # Crop all boxes of each image on the device, remembering which image each came from
+        crop_batches = []
+        kept_boxes = []
+        owners = []
+        for i, (img_rgb, boxes) in enumerate(zip(images, proposals)):
+            if len(boxes) == 0:
+                continue
+            crops, keep = extract_crops(image_to_tensor(img_rgb, self.device), boxes)
+            crop_batches.append(crops)
+            kept_boxes.append(boxes[keep])
+            owners.append(torch.full((crops.shape[0],), i, dtype=torch.long, device=self.device))
+
+        if not crop_batches:
+            return [[] for _ in images]
+
+        # Batch classify all crops in a single forward pass
+        batch = torch.cat(crop_batches)
+        if self.precision == 'fp16':
+            batch = batch.half()
+        top_probs, top_idx = self._classify(batch, top_k)
+        del batch, crop_batches
+
+        return self._build_detections(
+            top_probs, top_idx, torch.cat(kept_boxes), torch.cat(owners), top_k, len(images)
+        )
+
+    @torch.inference_mode()
+    def warmup(self, size=(480, 640)):
+        """Run both stages once on dummy data so the first real request does not pay for
+        lazy init and kernel selection. The classifier is fed directly because a dummy
+        image may yield no proposals."""
+        img = np.random.default_rng(0).integers(0, 256, (*size, 3), dtype=np.uint8)
+        self._propose([img])
+        batch = torch.zeros(2, 3, CLASSIFY_SIZE, CLASSIFY_SIZE, device=self.device)
+        if self.precision == 'fp16':
+            batch = batch.half()
+        self._classify(batch, top_k=1)
+
+    def predict(self, img_rgb, top_k=1):
+        return self.predict_batch([img_rgb], top_k=top_k)[0]
+
+    @staticmethod
+    def _class_names(detections) -> List[str]:
         return sorted({
             d['class'] if 'class' in d else d['predictions'][0]['class']
             for d in detections
         })
 
-    def predict_folder(self, folder: Path) -> Dict[str, List[str]]:
+    def predict_ingredients(self, image_path: Path) -> List[str]:
+        img_rgb = load_rgb(image_path)
+        if img_rgb is None:
+            self.logger.error(f"Could not read image: {image_path}")
+            return []
+        return self._class_names(self.predict(img_rgb))
+
+    def predict_folder(self, folder: Path, batch_size: int = 8) -> Dict[str, List[str]]:
         image_exts = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+        paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in image_exts)
+
         outputs = {}
-        for img in folder.iterdir():
-            if img.suffix.lower() in image_exts:
-                outputs[img.name] = self.predict_ingredients(img)
+        for chunk in batched(paths, batch_size):
+            loaded = []
+            for path in chunk:
+                img_rgb = load_rgb(path)
+                if img_rgb is None:
+                    self.logger.error(f"Could not read image: {path}")
+                    outputs[path.name] = []
+                    continue
+                loaded.append((path, img_rgb))
+
+            detections = self.predict_batch([img for _, img in loaded])
+            for (path, _), dets in zip(loaded, detections):
+                outputs[path.name] = self._class_names(dets)
         return outputs
 
 
@@ -324,12 +763,107 @@ def main():
         default=0.1,
         help='GD confidence threshold (default: 0.1). '
     )
+    parser.add_argument(
+        '--nms_iou',
+        type=float,
+        default=0.5,
+        help='IoU for suppressing overlapping GD proposals, 1 disables (default: 0.5)'
+    )
+    parser.add_argument(
+        '--max_proposals',
+        type=int,
+        default=50,
+        help='Maximum GD proposals classified per image, 0 disables (default: 50)'
+    )
+    parser.add_argument(
+        '--min_box_area',
+        type=float,
+        default=64.0,
+        help='Minimum proposal box area in pixels (default: 64)'
+    )
+    parser.add_argument(
+        '--class_merge_iou',
+        type=float,
+        default=None,
+        help='Merge overlapping boxes with the same predicted class at this IoU (default: off)'
+    )
+    parser.add_argument(
+        '--index',
+        choices=['auto', 'flat', 'ivf'],
+        default='auto',
+        help='Prototype search index; auto uses prototype_index.pt when present (default: auto)'
+    )
+    parser.add_argument(
+        '--nprobe',
+        type=int,
+        default=None,
+        help='IVF buckets scanned per crop (default: value stored in the index)'
+    )
+    parser.add_argument(
+        '--prototypes',
+        default='prototypes.pt',
+        help='Prototype file in model_dir, e.g. a bank from build_bank.py (default: prototypes.pt)'
+    )
+    parser.add_argument(
+        '--vote',
+        choices=['max', 'knn'],
+        default='max',
+        help='Per-class score: best prototype (max) or k-NN vote (default: max)'
+    )
+    parser.add_argument(
+        '--knn_k',
+        type=int,
+        default=10,
+        help='Neighbours that vote when --vote knn (default: 10)'
+    )
+    parser.add_argument(
+        '--precision',
+        choices=PRECISIONS,
+        default='auto',
+        help='Inference precision; auto is fp16 on CUDA and fp32 on CPU (default: auto)'
+    )
+    parser.add_argument(
+        '--backend',
+        choices=BACKENDS,
+        default='torch',
+        help='Classifier runtime; onnx/torchscript/bundle need an artifact from export.py (default: torch)'
+    )
+    parser.add_argument(
+        '--backend_threads',
+        type=int,
+        default=0,
+        help='ONNX Runtime intra-op threads (default: 0 = runtime default)'
+    )
+    parser.add_argument(
+        '--tile_size',
+        type=int,
+        default=None,
+        help='Run Grounding DINO on overlapping tiles of this size in pixels (default: off)'
+    )
+    parser.add_argument(
+        '--tile_overlap',
+        type=float,
+        default=0.2,
+        help='Fractional overlap between neighbouring tiles (default: 0.2)'
+    )
+    parser.add_argument(
+        '--tile_batch_size',
+        type=int,
+        default=8,
+        help='Tiles per Grounding DINO forward pass (default: 8)'
+    )
     parser.add_argument(
         '--top_k',
         type=int,
         default=1,
         help='Top-k class predictions per region (default: 1)'
     )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=8,
+        help='Images per batched Grounding DINO / classifier pass (default: 8)'
+    )
     parser.add_argument(
         '--output',
         type=Path,
@@ -361,6 +895,21 @@ def main():
         gd_prompt=args.prompt,
         gd_threshold=args.threshold,
         device=args.device,
+        nms_iou=args.nms_iou,
+        max_proposals=args.max_proposals,
+        min_box_area=args.min_box_area,
+        class_merge_iou=args.class_merge_iou,
+        index=args.index,
+        nprobe=args.nprobe,
+        prototypes_file=args.prototypes,
+        vote=args.vote,
+        knn_k=args.knn_k,
+        precision=args.precision,
+        backend=args.backend,
+        backend_threads=args.backend_threads,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+        tile_batch_size=args.tile_batch_size,
     )
 
     if args.visualise:
@@ -375,29 +924,32 @@ def main():
     print(f'\nRunning on {len(img_paths)} image(s)...\n')
 
     all_results = {}
-    for path in img_paths:
+    for chunk in batched(img_paths, args.batch_size):
         t0 = time.time()
-        img_bgr = cv2.imread(str(path))
-        if img_bgr is None:
-            print(f'Could not read: {path}')
-            continue
-        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-
-        detections = pipeline.predict(img_rgb, top_k=args.top_k)
-        elapsed = time.time() - t0
-
-        print(f'{path.name}  [{elapsed:.1f}s]  {len(detections)} detections')
-        for d in detections:
-            if 'class' in d:
-                print(f'  {d["class"]:<30} conf={d["confidence"]:.3f}  box={d["box"]}')
-            else:
-                top = d['predictions'][0]
-                print(f'  {top["class"]:<30} conf={top["confidence"]:.3f}  box={d["box"]}')
+        loaded = []
+        for path in chunk:
+            img_rgb = load_rgb(path)
+            if img_rgb is None:
+                print(f'Could not read: {path}')
+                continue
+            loaded.append((path, img_rgb))
+
+        batch_detections = pipeline.predict_batch([img for _, img in loaded], top_k=args.top_k)
+        elapsed = (time.time() - t0) / max(1, len(loaded))
+
+        for (path, img_rgb), detections in zip(loaded, batch_detections):
+            print(f'{path.name}  [{elapsed:.1f}s/img]  {len(detections)} detections')
+            for d in detections:
+                if 'class' in d:
+                    print(f'  {d["class"]:<30} conf={d["confidence"]:.3f}  box={d["box"]}')
+                else:
+                    top = d['predictions'][0]
+                    print(f'  {top["class"]:<30} conf={top["confidence"]:.3f}  box={d["box"]}')
 
-        all_results[path.name] = detections
+            all_results[path.name] = detections
 
-        if args.visualise and detections:
-            visualise_and_save(img_rgb, detections, args.vis_dir / f'{path.stem}_vis.jpg')
+            if args.visualise and detections:
+                visualise_and_save(img_rgb, detections, args.vis_dir / f'{path.stem}_vis.jpg')
 
     if args.output:
         with open(args.output, 'w') as f:
@@ -0,0 +1,117 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import torch
+
+from model.main.backends import (BundleScorer, EmbedScorer, artifact_path,
+                                 metadata_path, save_bundle)
+from model.main.detect import (CLASSIFY_SIZE, MODEL_DIR, load_class_names,
+                               load_classifier)
+from model.main.index import file_hash, load_prototypes
+
+
+def export_onnx(scorer, example, path, opset):
+    torch.onnx.export(
+        scorer,
+        (example,),
+        str(path),
+        input_names=['crops'],
+        output_names=['embeddings', 'sims'],
+        dynamic_axes={'crops': {0: 'batch'}, 'embeddings': {0: 'batch'}, 'sims': {0: 'batch'}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+
+
+def export_torchscript(scorer, example, path):
+    traced = torch.jit.trace(scorer, example, check_trace=False)
+    traced.save(str(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export the ArcFace embed path plus the prototype matmul for the onnx/torchscript/bundle backends'
+    )
+
+    parser.add_argument(
+        '--model_dir',
+        type=Path,
+        default=MODEL_DIR,
+        help='Folder containing arcface_final.pt, prototypes.pt, data.yaml; artifacts are written here'
+    )
+    parser.add_argument(
+        '--format',
+        choices=['onnx', 'torchscript', 'both', 'bundle'],
+        default='both',
+        help='Artifact(s) to write; both = onnx + torchscript, bundle = self-contained pipeline_bundle.pt (default: both)'
+    )
+    parser.add_argument(
+        '--prototypes',
+        default='prototypes.pt',
+        help='Prototype file baked into the matmul (default: prototypes.pt)'
+    )
+    parser.add_argument(
+        '--opset',
+        type=int,
+        default=17,
+        help='ONNX opset version (default: 17)'
+    )
+
+    args = parser.parse_args()
+
+    proto_path = args.model_dir / args.prototypes
+    class_names = load_class_names(args.model_dir, proto_path)
+    prototypes, labels = load_prototypes(proto_path)
+
+    # Export on CPU in fp32; runtimes pick their own device
+    weights_path = args.model_dir / 'arcface_final.pt'
+    classifier = load_classifier(weights_path, len(class_names), torch.device('cpu'))
+    scorer = EmbedScorer(classifier, prototypes).eval()
+    example = torch.randn(2, 3, CLASSIFY_SIZE, CLASSIFY_SIZE)
+
+    if args.format == 'bundle':
+        path = artifact_path(args.model_dir, 'bundle')
+        bundle = BundleScorer(classifier, prototypes, labels).eval()
+        with torch.no_grad():
+            save_bundle(
+                bundle, example, class_names, path,
+                prototypes_file=args.prototypes, input_size=CLASSIFY_SIZE,
+            )
+        print(f'Saved bundle: {path} ({path.stat().st_size / 1e6:.1f} MB, {len(class_names)} classes)')
+        return
+
+    formats = ['onnx', 'torchscript'] if args.format == 'both' else [args.format]
+    with torch.no_grad():
+        reference = scorer(example)[1]
+        for fmt in formats:
+            path = artifact_path(args.model_dir, fmt)
+            t0 = time.time()
+            if fmt == 'onnx':
+                export_onnx(scorer, example, path, args.opset)
+            else:
+                export_torchscript(scorer, example, path)
+            print(f'Exported {fmt}: {path} ({time.time() - t0:.1f}s)')
+
+        if 'torchscript' in formats:
+            loaded = torch.jit.load(str(artifact_path(args.model_dir, 'torchscript')))
+            err = (loaded(example)[1] - reference).abs().max().item()
+            print(f'TorchScript max abs error vs eager: {err:.2e}')
+
+    metadata = {
+        'prototypes_file': args.prototypes,
+        # Content hashes, so the pipeline can tell retrained weights or prototypes from the exported ones
+        'prototypes_hash': file_hash(proto_path),
+        'weights_hash': file_hash(weights_path),
+        'num_prototypes': int(prototypes.shape[0]),
+        'embed_dim': int(prototypes.shape[1]),
+        'input_size': CLASSIFY_SIZE,
+        'opset': args.opset,
+    }
+    metadata_path(args.model_dir).write_text(json.dumps(metadata, indent=2))
+    print(f'Saved: {metadata_path(args.model_dir)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import math
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+
+MODEL_DIR = Path(__file__).resolve().parent / "assets"
+INDEX_FILE = 'prototype_index.pt'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Short content hash of a file, recorded with derived artifacts so stale ones are detected."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def spherical_kmeans(x, n_clusters, n_iter=20, seed=0):
+    """k-means on unit vectors with cosine assignment. Returns (centroids, assignment).
+
+    Clusters that end up empty are dropped, so every returned centroid owns
+    at least one vector.
+    """
+    unit = F.normalize(x.float(), dim=1)
+    n_clusters = min(n_clusters, len(unit))
+
+    g = torch.Generator().manual_seed(seed)
+    centroids = unit[torch.randperm(len(unit), generator=g)[:n_clusters]].clone()
+    for _ in range(n_iter):
+        assign = torch.mm(unit, centroids.T).argmax(dim=1)
+        sums = torch.zeros_like(centroids).index_add_(0, assign, unit)
+        counts = torch.bincount(assign, minlength=n_clusters)
+        # Keep the old centroid for clusters that emptied out
+        sums[counts == 0] = centroids[counts == 0]
+        centroids = F.normalize(sums, dim=1)
+
+    assign = torch.mm(unit, centroids.T).argmax(dim=1)
+    used = torch.bincount(assign, minlength=len(centroids)) > 0
+    # Renumber the surviving clusters 0..K'-1
+    remap = torch.cumsum(used, 0) - 1
+    return centroids[used], remap[assign]
+
+
+class FlatIndex:
+    """Exact search: one dense matmul against every prototype."""
+
+    kind = 'flat'
+
+    def __init__(self, vectors, labels):
+        self.vectors = vectors
+        self.labels = labels
+        # The common one-prototype-per-class layout needs no segmented max
+        self.one_per_class = torch.equal(labels.cpu(), torch.arange(len(labels)))
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def to(self, device, dtype=None):
+        self.vectors = self.vectors.to(device, dtype or self.vectors.dtype)
+        self.labels = self.labels.to(device)
+        return self
+
+    def scores(self, queries):
+        """Dense (N, M) cosine similarities against every prototype."""
+        return torch.mm(queries, self.vectors.T).float()
+
+    def search(self, queries, k):
+        """Top-k prototypes per query.
+
+        Returns (scores, ids, lse): the (N, k) similarities and prototype ids,
+        plus the log-sum-exp of each query's similarities over every scored
+        prototype so callers can turn scores into softmax probabilities.
+        """
+        sims = self.scores(queries)
+        scores, ids = sims.topk(min(k, len(self)), dim=1)
+        return scores, ids, torch.logsumexp(sims, dim=1)
+
+    def class_scores(self, queries, num_classes, sims=None):
+        """(N, num_classes) best similarity of each query to any prototype of each class.
+
+        ``sims`` may pass in precomputed dense similarities, e.g. from an
+        exported classifier that already did the prototype matmul.
+        """
+        if sims is None:
+            sims = self.scores(queries)
+        if self.one_per_class and sims.shape[1] == num_classes:
+            return sims
+        out = sims.new_full((sims.shape[0], num_classes), float('-inf'))
+        return out.scatter_reduce_(1, self.labels.expand_as(sims), sims, 'amax')
+
+    def state_dict(self):
+        return {'kind': self.kind, 'vectors': self.vectors, 'labels': self.labels}
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index: prototypes are bucketed by a spherical k-means
+    coarse quantizer and only the ``nprobe`` closest buckets are scanned.
+
+    Probabilities from ``search`` are normalized over the scanned candidates
+    only, so they approximate the flat index's softmax.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, vectors, labels, centroids, lists, nprobe=8, query_chunk=64):
+        super().__init__(vectors, labels)
+        # An empty bucket would score every probed class -inf (and NaN after
+        # softmax); indexes built before empty clusters were dropped may have some
+        nonempty = (lists >= 0).any(dim=1)
+        self.centroids = centroids[nonempty]
+        # (n_lists, max_list_len) prototype ids, padded with -1
+        self.lists = lists[nonempty]
+        self.nprobe = nprobe
+        self.query_chunk = query_chunk
+
+    @classmethod
+    def build(cls, vectors, labels, n_lists=None, n_iter=20, seed=0, nprobe=8):
+        # Cluster on unit vectors; the stored prototypes are left as they are
+        n_lists = n_lists or max(1, int(math.sqrt(len(vectors))))
+        centroids, assign = spherical_kmeans(vectors, n_lists, n_iter=n_iter, seed=seed)
+        n_lists = centroids.shape[0]
+
+        counts = torch.bincount(assign, minlength=n_lists)
+        lists = torch.full((n_lists, int(counts.max())), -1, dtype=torch.long)
+        order = assign.argsort(stable=True)
+        starts = torch.cumsum(counts, 0) - counts
+        slots = torch.arange(len(vectors)) - starts[assign[order]]
+        lists[assign[order], slots] = order
+
+        return cls(vectors, labels, centroids, lists, nprobe=nprobe)
+
+    def to(self, device, dtype=None):
+        super().to(device, dtype)
+        self.centroids = self.centroids.to(device, dtype or self.centroids.dtype)
+        self.lists = self.lists.to(device)
+        return self
+
+    def _scan(self, queries):
+        """Yield (sims, candidate ids) for chunks of queries over their probed buckets.
+
+        Padding slots have id -1 and similarity -inf. Chunking bounds the
+        (chunk, candidates, dim) gather.
+        """
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        probe = torch.mm(queries, self.centroids.T).topk(nprobe, dim=1).indices
+
+        for start in range(0, queries.shape[0], self.query_chunk):
+            q = queries[start:start + self.query_chunk]
+            cand = self.lists[probe[start:start + self.query_chunk]].flatten(1)
+            sims = torch.einsum('nd,npd->np', q, self.vectors[cand.clamp(min=0)]).float()
+            yield sims.masked_fill(cand < 0, float('-inf')), cand
+
+    def search(self, queries, k):
+        k = min(k, len(self))
+        results = []
+        for sims, cand in self._scan(queries):
+            scores, pos = sims.topk(min(k, sims.shape[1]), dim=1)
+            results.append((scores, cand.gather(1, pos), torch.logsumexp(sims, dim=1)))
+
+        scores, ids, lse = (torch.cat(parts) for parts in zip(*results))
+        return scores, ids, lse
+
+    def class_scores(self, queries, num_classes, sims=None):
+        """Like FlatIndex.class_scores, but classes with no scanned prototype stay at -inf.
+
+        Dense ``sims`` are ignored; the point of IVF is not to compute them.
+        """
+        parts = []
+        for sims, cand in self._scan(queries):
+            out = sims.new_full((sims.shape[0], num_classes), float('-inf'))
+            parts.append(out.scatter_reduce_(1, self.labels[cand.clamp(min=0)], sims, 'amax'))
+        return torch.cat(parts)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update({'centroids': self.centroids, 'lists': self.lists, 'nprobe': self.nprobe})
+        return state
+
+
+INDEX_KINDS = {'flat': FlatIndex, 'ivf': IVFIndex}
+
+
+def index_path_for(proto_path):
+    """Where the index built from a prototype file lives: prototype_index.pt for
+    the default prototypes.pt, <stem>_index.pt next to any other bank."""
+    proto_path = Path(proto_path)
+    if proto_path.name == 'prototypes.pt':
+        return proto_path.with_name(INDEX_FILE)
+    return proto_path.with_name(f'{proto_path.stem}_index.pt')
+
+
+def save_index(index, path, source_hash=None):
+    """Persist an index; ``source_hash`` is the file_hash of the prototype file it was built from."""
+    state = index.state_dict()
+    state['source_hash'] = source_hash
+    torch.save(state, path)
+
+
+def load_index(path, nprobe=None):
+    """Load a persisted index. Tensors are memory-mapped rather than read into RAM.
+
+    The returned index carries ``source_hash`` (None for files saved without one).
+    """
+    state = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    if state['kind'] == 'ivf':
+        index = IVFIndex(
+            state['vectors'], state['labels'], state['centroids'], state['lists'],
+            nprobe=nprobe or state['nprobe'],
+        )
+    else:
+        index = FlatIndex(state['vectors'], state['labels'])
+    index.source_hash = state.get('source_hash')
+    return index
+
+
+def load_prototypes(proto_path):
+    """Prototype vectors and their class labels from prototypes.pt.
+
+    Accepts a single (C, D) prototype per class, or a bank with a
+    'labels' tensor giving the class of each row.
+    """
+    proto_data = torch.load(proto_path, map_location='cpu')
+    vectors = proto_data['prototypes']
+    labels = proto_data.get('labels')
+    if labels is None:
+        labels = torch.arange(vectors.shape[0])
+    return vectors, labels.long()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a prototype search index from prototypes.pt')
+
+    parser.add_argument(
+        '--model_dir',
+        type=Path,
+        default=MODEL_DIR,
+        help='Folder containing the prototype file; the index is written next to it'
+    )
+    parser.add_argument(
+        '--prototypes',
+        default='prototypes.pt',
+        help='Prototype file in model_dir, e.g. a bank from build_bank.py (default: prototypes.pt)'
+    )
+    parser.add_argument(
+        '--kind',
+        choices=sorted(INDEX_KINDS),
+        default='ivf',
+        help='Index type (default: ivf)'
+    )
+    parser.add_argument(
+        '--n_lists',
+        type=int,
+        default=None,
+        help='IVF buckets (default: sqrt(#prototypes))'
+    )
+    parser.add_argument(
+        '--nprobe',
+        type=int,
+        default=8,
+        help='IVF buckets scanned per query (default: 8)'
+    )
+    parser.add_argument(
+        '--output',
+        type=Path,
+        default=None,
+        help=f'Output path (default: <model_dir>/{INDEX_FILE}, or <bank>_index.pt for other prototype files)'
+    )
+
+    args = parser.parse_args()
+
+    proto_path = args.model_dir / args.prototypes
+    vectors, labels = load_prototypes(proto_path)
+    if args.kind == 'ivf':
+        index = IVFIndex.build(vectors, labels, n_lists=args.n_lists, nprobe=args.nprobe)
+        print(f'Built IVF index: {len(index)} prototypes in {index.centroids.shape[0]} lists')
+    else:
+        index = FlatIndex(vectors, labels)
+        print(f'Built flat index: {len(index)} prototypes')
+
+    out_path = args.output or index_path_for(proto_path)
+    save_index(index, out_path, source_hash=file_hash(proto_path))
+    print(f'Saved: {out_path}')
+
+
+if __name__ == '__main__':
+    main()
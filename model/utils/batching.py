@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from model.utils.executor import ExecutorBusy
+from model.utils.logger import setup_logger
+
+logger = setup_logger(__name__, "batching.log")
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-item requests into batched calls.
+
+    Callers ``await submit(item)``. A background task collects queued items
+    until ``max_batch_size`` is reached or ``max_wait_ms`` has passed since
+    the first item arrived, hands the whole list to ``process_batch`` and
+    fans the per-item results back to the waiting callers. When
+    ``max_pending`` items are already queued, ``submit`` raises
+    ``ExecutorBusy`` instead of growing the queue.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_pending: int = 0,
+        name: str = "batcher",
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_pending = max(0, max_pending)
+        self.name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Fail anything still queued rather than leaving callers hanging
+        while self._queue is not None and not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"{self.name} stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, fut))
+        except asyncio.QueueFull:
+            logger.warning(f"{self.name}: {self._queue.qsize()} requests queued, rejecting")
+            raise ExecutorBusy(f"{self.name} detector is busy, retry later")
+        return await fut
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Drop callers that gave up (e.g. client disconnected) while we waited
+        return [(item, fut) for item, fut in batch if not fut.done()]
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            logger.debug(f"{self.name}: dispatching batch of {len(items)}")
+            try:
+                results = await self.process_batch(items)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
@@ -0,0 +1,122 @@
+import gc
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def set_f1(predicted: Iterable[str], reference: Iterable[str]) -> float:
+    """F1 between two sets of class names; two empty sets count as a perfect match."""
+    predicted, reference = set(predicted), set(reference)
+    if not predicted and not reference:
+        return 1.0
+    overlap = len(predicted & reference)
+    return 2 * overlap / (len(predicted) + len(reference))
+
+
+def print_precision_report(
+    latencies: Dict[str, List[float]],
+    outputs: Dict[str, Dict[str, List[str]]],
+    reference: Dict[str, List[str]],
+    reference_name: str,
+    baseline: Optional[str] = "fp32",
+    column: str = "precision",
+) -> None:
+    """Table of median latency, speed-up over the baseline and mean class-set F1 against the reference.
+
+    Rows are whatever ``latencies`` is keyed on (precisions, or backends with ``column="backend"``).
+    """
+    base = statistics.median(latencies[baseline]) if baseline in latencies else None
+
+    print(f"{column:<10} {'median ms':>10} {'speed-up':>9} {'F1 vs ' + reference_name:>16}")
+    for precision, samples in latencies.items():
+        median = statistics.median(samples)
+        speedup = f"{base / median:8.2f}x" if base else f"{'-':>9}"
+        f1 = statistics.mean(
+            set_f1(outputs[precision].get(name, []), classes) for name, classes in reference.items()
+        )
+        print(f"{precision:<10} {median * 1000:10.1f} {speedup} {f1:16.3f}")
+
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def load_named_images(path: Path, limit: int) -> List[Tuple[str, np.ndarray]]:
+    """(filename, RGB array) for an image file, or the first ``limit`` images of a directory.
+
+    Unreadable files are skipped.
+    """
+    if path.is_dir():
+        paths = sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTS)[:limit]
+    else:
+        paths = [path]
+    named = []
+    for p in paths:
+        img = cv2.imread(str(p))
+        if img is not None:
+            named.append((p.name, cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+    return named
+
+
+def bench_variants(
+    variants: Sequence[str],
+    build: Callable[[str], Any],
+    predict: Callable[[Any, np.ndarray], Any],
+    classes: Callable[[Any], List[str]],
+    named_images: List[Tuple[str, np.ndarray]],
+    runs: int,
+    sync: Optional[Callable[[Any], None]] = None,
+    after: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[Dict[str, List[float]], Dict[str, Dict[str, List[str]]]]:
+    """Build one model per variant (precision, backend...) and time it on the same images.
+
+    The first pass records each image's class set (and warms up the model).
+    The timed passes record seconds per image. ``sync`` runs around each
+    timed call, e.g. to wait for CUDA. ``after`` can measure more before the
+    model is released. Returns (latencies, outputs) for print_precision_report.
+    """
+    latencies, outputs = {}, {}
+    for variant in variants:
+        model = build(variant)
+        outputs[variant] = {name: classes(predict(model, img)) for name, img in named_images}
+        samples = []
+        for _ in range(runs):
+            for _, img in named_images:
+                if sync:
+                    sync(model)
+                t0 = time.perf_counter()
+                predict(model, img)
+                if sync:
+                    sync(model)
+                samples.append(time.perf_counter() - t0)
+        latencies[variant] = samples
+        if after:
+            after(variant, model)
+
+        del model
+        gc.collect()
+    return latencies, outputs
+
+
+def print_variant_report(
+    title: str,
+    named_images: List[Tuple[str, np.ndarray]],
+    latencies: Dict[str, List[float]],
+    outputs: Dict[str, Dict[str, List[str]]],
+    labels: Optional[Dict[str, List[str]]] = None,
+    baseline: str = "fp32",
+    column: str = "precision",
+) -> None:
+    """print_precision_report against ``labels`` ({filename: [classes]}) when given, else against the baseline's outputs."""
+    if labels is not None:
+        reference = {name: labels.get(name, []) for name, _ in named_images}
+        reference_name = "labels"
+    else:
+        reference = outputs[baseline]
+        reference_name = baseline
+
+    print(title)
+    print_precision_report(latencies, outputs, reference, reference_name, baseline=baseline, column=column)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from model.utils.logger import setup_logger
+
+logger = setup_logger(__name__, "cache.log")
+
+
+def image_key(img: np.ndarray, detector: str, **params) -> str:
+    """Content hash of a decoded image plus the detector settings that affect its result."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(detector.encode())
+    h.update(repr(sorted(params.items())).encode())
+    h.update(f"{img.shape}{img.dtype.str}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class _SqliteTier:
+    """Persistent second tier so cached results survive restarts."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: Path, max_entries: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        self._puts = 0
+
+    def get(self, key: str, now: float) -> Optional[Any]:
+        row = self._conn.execute(
+            "SELECT value FROM results WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, expires_at: float, now: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now),
+        )
+        self._puts += 1
+        if self._puts % self.PRUNE_EVERY == 0:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        self._conn.execute("DELETE FROM results")
+
+
+class ResultCache:
+    """In-process LRU + TTL cache for detection results with an optional sqlite tier.
+
+    Values must be JSON-serializable when the disk tier is enabled.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_s: float = 3600,
+        disk_path: Optional[Path] = None,
+        disk_max_entries: int = 100_000,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Detectors run in executor threads but the API touches the cache from the loop;
+        # the lock keeps it safe for either caller.
+        self._lock = threading.Lock()
+        self._disk = _SqliteTier(Path(disk_path), disk_max_entries) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._disk is not None:
+                value = self._disk.get(key, now)
+                if value is not None:
+                    self._remember(key, value, now + self.ttl_s)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_s
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._disk is not None:
+                try:
+                    self._disk.put(key, value, expires_at, now)
+                except sqlite3.Error as e:
+                    logger.warning(f"Disk cache write failed: {e}")
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
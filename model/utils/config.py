@@ -25,8 +25,71 @@ class Settings(BaseSettings):
     max_width: int = 4096
     max_height: int = 4096
     max_long_side: int = 800
+    max_batch_files: int = 32
 
+    # INFERENCE EXECUTOR CONFIGS
+    inference_workers: int = 1
+    inference_queue_size: int = 16
+    azure_workers: int = 4
+
+    # WORKER PROCESS CONFIGS (0 processes = run detectors in the API process)
+    worker_processes: int = 0
+    worker_torch_threads: int = 0
+    worker_detectors: str = "main,yolo"
+
+    # STARTUP CONFIGS (detectors loaded in the background at startup; the rest load on first request)
+    preload_detectors: str = "main"
+    preload_warmup: bool = True
+
+    # MAIN PIPELINE CONFIGS
     gd_threshold: float = 0.1
+    gd_nms_iou: float = 0.5
+    gd_max_proposals: int = 50
+    gd_min_box_area: float = 64.0
+    class_merge_iou: float = 0.0
+    main_index: str = "auto"
+    main_nprobe: int = 0
+    main_prototypes_file: str = "prototypes.pt"
+    main_vote: str = "max"
+    main_knn_k: int = 10
+    main_precision: str = "auto"
+    main_backend: str = "torch"
+    main_backend_threads: int = 0
+    main_batch_size: int = 8
+    main_batch_wait_ms: float = 10.0
+
+    # YOLO / CLIP DETECTOR CONFIGS
+    yolo_confidence_threshold: float = 0.25
+    yolo_iou_threshold: float = 0.45
+    yolo_batch_size: int = 16
+    yolo_export_format: str = "pt"
+    clip_sim_threshold: float = 0.25
+    clip_precision: str = "auto"
+    clip_batch_size: int = 32
+    clip_mode: str = "image"
+    clip_region_scales: str = "1,2,3"
+
+    # CLIP TIER CONFIGS (model:pretrained, heaviest first; later tiers serve under load, 0 disables a trigger)
+    clip_tiers: str = "ViT-L-14:laion2b_s32b_b82k"
+    clip_fallback_queue_depth: int = 0
+    clip_fallback_p95_ms: float = 0.0
+    clip_latency_window: int = 100
+    clip_latency_max_age_s: float = 30.0
+
+    # TILED INFERENCE CONFIGS (detectors listed here keep more resolution and run on overlapping tiles)
+    tile_detectors: str = ""
+    tile_size: int = 640
+    tile_overlap: float = 0.2
+    tile_max_long_side: int = 2400
+    main_tile_batch_size: int = 8
+    yolo_tile_batch_size: int = 32
+
+    # RESULT CACHE CONFIGS (empty disk path = in-memory only)
+    cache_enabled: bool = True
+    cache_max_entries: int = 1024
+    cache_ttl_s: int = 3600
+    cache_disk_path: str = ""
+    cache_disk_max_entries: int = 100000
 
     ingredients_list_path: str = str(_PROJECT_ROOT / "assets" / "classes.txt")
 
@@ -0,0 +1,51 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from model.utils.logger import setup_logger
+
+logger = setup_logger(__name__, "executor.log")
+
+
+class ExecutorBusy(Exception):
+    """Raised when an inference executor has no free capacity."""
+
+
+class InferenceExecutor:
+    """Bounded thread pool that runs blocking detector calls off the event loop.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a worker; anything beyond that is rejected immediately with
+    ``ExecutorBusy`` so the API can answer 503 instead of piling up work.
+    """
+
+    def __init__(self, name: str, max_workers: int = 1, max_queue: int = 16):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.capacity = self.max_workers + max(0, max_queue)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"infer-{name}",
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._pending >= self.capacity:
+            logger.warning(f"{self.name} executor full ({self._pending} pending), rejecting")
+            raise ExecutorBusy(f"{self.name} detector is busy, retry later")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,36 @@
+import contextlib
+
+import torch
+import torch.nn as nn
+
+PRECISIONS = ("auto", "fp32", "fp16", "bf16", "int8")
+
+
+def resolve_precision(precision: str, device: torch.device, auto: str = "fp32") -> str:
+    """Concrete precision for a device; 'auto' maps to the detector's own default."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+    if precision == "auto":
+        return auto
+    if precision == "fp16" and device.type != "cuda":
+        raise ValueError("fp16 is only supported on CUDA; use bf16 or int8 on CPU")
+    if precision == "int8" and device.type != "cpu":
+        # Dynamically quantized linear kernels only exist for CPU
+        raise ValueError("int8 is only supported on CPU")
+    return precision
+
+
+def quantize_linear(module: nn.Module) -> nn.Module:
+    """Dynamic int8 quantization of every nn.Linear, in place.
+
+    Weights are stored as int8 and activations are quantized per batch at
+    run time, so no calibration data is needed.
+    """
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def autocast(precision: str, device: torch.device):
+    """Autocast context for bf16; a no-op for every other precision."""
+    if precision == "bf16":
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
@@ -7,12 +7,16 @@ from model.utils.logger import setup_logger
 logger = setup_logger(__name__, "preprocess.log")
 
 
-def validate_image(img: np.ndarray, file_size: int | None = None) -> np.ndarray:
+def validate_image(
+    img: np.ndarray,
+    file_size: int | None = None,
+    max_long_side: int | None = None,
+) -> np.ndarray:
     if img is None or img.size == 0:
         raise ValueError("Empty or unreadable image")
 
     max_file_bytes = settings.max_file_mb * 1024 * 1024
-    max_long_side = settings.max_long_side
+    max_long_side = max_long_side or settings.max_long_side
 
     if file_size is not None and file_size > max_file_bytes:
         raise ValueError(
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+
+class LatencyWindow:
+    """Sliding window of recent inference latencies (ms).
+
+    Samples older than ``max_age_s`` (0 keeps them until pushed out) are
+    ignored, so a window that stops receiving samples goes stale and empty.
+    """
+
+    def __init__(self, size: int = 100, max_age_s: float = 0.0):
+        self._samples = deque(maxlen=max(1, size))
+        self.max_age_s = max_age_s
+        # Recorded from executor threads, read from the event loop
+        self._lock = threading.Lock()
+
+    def record(self, ms: float) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), ms))
+
+    def percentile(self, q: float) -> Optional[float]:
+        cutoff = time.monotonic() - self.max_age_s if self.max_age_s > 0 else float("-inf")
+        with self._lock:
+            recent = [ms for t, ms in self._samples if t >= cutoff]
+        if not recent:
+            return None
+        return float(np.percentile(np.asarray(recent, dtype=np.float64), q))
+
+
+class LoadTierSelector:
+    """Decides when a detector should shed load to a lighter tier.
+
+    The service degrades when the primary tier has ``max_pending`` or more
+    calls in flight, or when the p95 of its recent latencies reaches
+    ``p95_ms`` (0 disables either trigger). Only primary-tier latencies may
+    be recorded: fast fallback samples would pull p95 down and flip the
+    tier back while the primary is still overloaded. While degraded the
+    primary gets no traffic, so its samples age out after ``max_age_s``
+    and the primary is tried again. Recovery also needs both signals back
+    under ``recover_ratio`` of their thresholds, so a burst does not flip
+    the tier on every request.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 0,
+        p95_ms: float = 0.0,
+        window: int = 100,
+        max_age_s: float = 30.0,
+        recover_ratio: float = 0.5,
+    ):
+        self.max_pending = max_pending
+        self.p95_ms = p95_ms
+        self.recover_ratio = recover_ratio
+        self.latency = LatencyWindow(window, max_age_s)
+        self.degraded = False
+
+    def _over(self, pending: int, p95: Optional[float], ratio: float) -> bool:
+        if self.max_pending > 0 and pending >= self.max_pending * ratio:
+            return True
+        return self.p95_ms > 0 and p95 is not None and p95 >= self.p95_ms * ratio
+
+    def update(self, pending: int) -> bool:
+        """Whether to serve from a fallback tier, given the primary tier's in-flight count."""
+        p95 = self.latency.percentile(95)
+        if self.degraded:
+            self.degraded = self._over(pending, p95, self.recover_ratio)
+        else:
+            self.degraded = self._over(pending, p95, 1.0)
+        return self.degraded
@@ -0,0 +1,74 @@
+from typing import List, Tuple
+
+import numpy as np
+import torch
+from torchvision.ops import batched_nms
+
+# (x1, y1, x2, y2) window of a tile in full-image pixels
+Window = Tuple[int, int, int, int]
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: float = 0.2) -> List[Window]:
+    """Overlapping tile windows covering an image.
+
+    Tiles step by ``tile_size * (1 - overlap)``; the last row and column are
+    shifted inward so every tile stays full size. An image no larger than
+    one tile yields a single window.
+    """
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def slice_image(
+    img: np.ndarray,
+    tile_size: int,
+    overlap: float = 0.2,
+    include_full: bool = True,
+) -> Tuple[List[np.ndarray], List[Tuple[int, int]]]:
+    """Cut an HWC image into overlapping tiles (views, no copies).
+
+    Returns the tiles and the (x, y) offset of each one. With
+    ``include_full`` the whole image is appended as a last "tile" so
+    objects larger than a tile are still seen in one piece.
+    """
+    windows = tile_grid(img.shape[0], img.shape[1], tile_size, overlap)
+    if len(windows) == 1:
+        return [img], [(0, 0)]
+
+    tiles = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in windows]
+    offsets = [(x1, y1) for x1, y1, _, _ in windows]
+    if include_full:
+        tiles.append(img)
+        offsets.append((0, 0))
+    return tiles, offsets
+
+
+def shift_boxes(boxes: torch.Tensor, offset: Tuple[int, int]) -> torch.Tensor:
+    """Map (N, 4) xyxy boxes from tile coordinates back to the full image."""
+    x, y = offset
+    return boxes + boxes.new_tensor([x, y, x, y])
+
+
+def merge_tile_boxes(
+    boxes: torch.Tensor,
+    scores: torch.Tensor,
+    classes: torch.Tensor,
+    iou_threshold: float,
+) -> torch.Tensor:
+    """Cross-tile NMS: indices of the boxes to keep, highest score first.
+
+    Duplicates of the same object from overlapping tiles are suppressed
+    per class, so neighbouring objects of different classes survive.
+    """
+    return batched_nms(boxes.float(), scores.float(), classes, iou_threshold)
@@ -0,0 +1,26 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Wall-clock seconds spent in named stages, e.g. the steps of a cold start."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = round(time.perf_counter() - t0, 3)
+
+    @property
+    def total(self) -> float:
+        return round(sum(self.stages.values()), 3)
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name} {secs:.2f}s" for name, secs in self.stages.items())
+        return f"{parts} (total {self.total:.2f}s)"
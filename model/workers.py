@@ -0,0 +1,218 @@
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from model.utils.config import settings
+from model.utils.logger import setup_logger
+
+logger = setup_logger(__name__, "workers.log")
+
+MODEL_ROOT = Path(__file__).resolve().parent
+
+# (shared memory block name, shape, dtype) describing one image
+ShmSpec = Tuple[str, Tuple[int, ...], str]
+
+
+def tile_size(name: str) -> Optional[int]:
+    """Tile size for a detector, or None when it runs on the whole image."""
+    return settings.tile_size if name in parse_names(settings.tile_detectors) else None
+
+
+def clip_tiers() -> List[Tuple[str, str]]:
+    """(model_name, pretrained) per CLIP tier from CLIP_TIERS, heaviest first."""
+    tiers = []
+    for spec in parse_names(settings.clip_tiers):
+        model_name, _, pretrained = spec.partition(":")
+        tiers.append((model_name.strip(), pretrained.strip()))
+    return tiers
+
+
+def clip_tier_names() -> List[str]:
+    """API names of the CLIP tiers: "clip" for the primary, "clip:1", "clip:2"... for fallbacks."""
+    return ["clip"] + [f"clip:{i}" for i in range(1, len(clip_tiers()))]
+
+
+def build_detector(name: str):
+    """Construct a detector by its API name."""
+    # Imported lazily so worker processes only pay for the detectors they serve
+    if name == "yolo":
+        from model.yolo.detect import YOLODetector
+        return YOLODetector(
+            confidence_threshold=settings.yolo_confidence_threshold,
+            iou_threshold=settings.yolo_iou_threshold,
+            tile_size=tile_size("yolo"),
+            tile_overlap=settings.tile_overlap,
+            tile_batch_size=settings.yolo_tile_batch_size,
+            batch_size=settings.yolo_batch_size,
+            export_format=settings.yolo_export_format,
+        )
+    if name == "azure":
+        from model.azure.detect import AzureLLMDetector
+        return AzureLLMDetector()
+    if name in clip_tier_names():
+        from model.clip.detect import CLIPDetector
+        model_name, pretrained = clip_tiers()[clip_tier_names().index(name)]
+        return CLIPDetector(
+            model_name=model_name,
+            pretrained=pretrained,
+            sim_threshold=settings.clip_sim_threshold,
+            precision=settings.clip_precision,
+            batch_size=settings.clip_batch_size,
+            mode=settings.clip_mode,
+            region_scales=[int(s) for s in parse_names(settings.clip_region_scales)],
+        )
+    if name == "main":
+        from model.main.detect import Pipeline
+        return Pipeline(
+            model_dir=MODEL_ROOT / "main" / "assets",
+            gd_threshold=settings.gd_threshold,
+            nms_iou=settings.gd_nms_iou,
+            max_proposals=settings.gd_max_proposals,
+            min_box_area=settings.gd_min_box_area,
+            class_merge_iou=settings.class_merge_iou or None,
+            index=settings.main_index,
+            nprobe=settings.main_nprobe or None,
+            prototypes_file=settings.main_prototypes_file,
+            vote=settings.main_vote,
+            knn_k=settings.main_knn_k,
+            precision=settings.main_precision,
+            backend=settings.main_backend,
+            backend_threads=settings.main_backend_threads,
+            tile_size=tile_size("main"),
+            tile_overlap=settings.tile_overlap,
+            tile_batch_size=settings.main_tile_batch_size,
+        )
+    raise ValueError(f"Unknown detector: {name}")
+
+
+def parse_names(value: str) -> List[str]:
+    """Detector names from a comma-separated setting."""
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def warmup_detector(name: str, detector) -> None:
+    """One dummy inference so lazy init, allocator growth and kernel selection happen before traffic."""
+    if name == "main":
+        detector.warmup()
+    elif name == "yolo" or name in clip_tier_names():
+        img = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        detector.predict_detailed(img)
+    # Azure is a remote call that costs money; nothing local to warm up
+
+
+# ---- worker process side ----
+
+_worker_detectors = {}
+
+
+def _init_worker(names: Tuple[str, ...], torch_threads: int, counter, ready) -> None:
+    import torch
+
+    with counter.get_lock():
+        worker_id = counter.value
+        counter.value += 1
+
+    # Pin each worker to its own slice of cores so intra-op pools don't fight
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+    if hasattr(os, "sched_setaffinity"):
+        n_cpus = os.cpu_count() or 1
+        first = (worker_id * torch_threads) % n_cpus
+        cores = {(first + i) % n_cpus for i in range(torch_threads)}
+        os.sched_setaffinity(0, cores)
+
+    for name in names:
+        _worker_detectors[name] = build_detector(name)
+        if settings.preload_warmup:
+            warmup_detector(name, _worker_detectors[name])
+    with ready.get_lock():
+        ready.value += 1
+    logger.info(f"Worker {worker_id} (pid {os.getpid()}) ready with {list(names)}, {torch_threads} threads")
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _worker_call(name: str, method: str, specs: List[ShmSpec], batched: bool):
+    images = []
+    for shm_name, shape, dtype in specs:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # One local memcpy; the API process unlinks the block as soon as we return
+            images.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf).copy())
+        finally:
+            shm.close()
+
+    fn = getattr(_worker_detectors[name], method)
+    return fn(images) if batched else fn(images[0])
+
+
+# ---- API process side ----
+
+def _to_shared(img: np.ndarray) -> Tuple[shared_memory.SharedMemory, ShmSpec]:
+    shm = shared_memory.SharedMemory(create=True, size=max(1, img.nbytes))
+    np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+    return shm, (shm.name, img.shape, img.dtype.str)
+
+
+class WorkerPool:
+    """Pool of processes that each load their own copy of some detectors.
+
+    Images are handed over through ``multiprocessing.shared_memory`` so only
+    a small (name, shape, dtype) descriptor is pickled per request.
+    """
+
+    def __init__(self, detector_names: Iterable[str], num_workers: int, torch_threads: int = 0):
+        self.detectors = tuple(detector_names)
+        self.num_workers = max(1, num_workers)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+
+        # spawn, not fork: torch and CUDA state do not survive a fork
+        ctx = mp.get_context("spawn")
+        # Workers that finished loading (and warming up) their detectors
+        self._ready = ctx.Value("i", 0)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.detectors, self.torch_threads, ctx.Value("i", 0), self._ready),
+        )
+
+    def warmup(self, poll_s: float = 0.1) -> None:
+        """Start every worker and block until all of them have loaded their detectors.
+
+        The pings only make the pool spawn its processes; the first worker up
+        may answer all of them, so readiness is counted by the workers themselves.
+        """
+        logger.info(f"Starting {self.num_workers} worker(s) for {list(self.detectors)}...")
+        pings = [self._pool.submit(_worker_ping) for _ in range(self.num_workers)]
+        while self._ready.value < self.num_workers:
+            for ping in pings:
+                # A worker whose initializer failed breaks the pool; surface that instead of waiting forever
+                if ping.done() and ping.exception() is not None:
+                    raise ping.exception()
+            time.sleep(poll_s)
+        pids = {ping.result() for ping in pings}
+        logger.info(f"All {self.num_workers} workers ready (pinged: {sorted(pids)})")
+
+    def call(self, name: str, method: str, images: Union[np.ndarray, List[np.ndarray]]):
+        """Run ``detector.method`` in a worker. Blocks, so call it from a thread."""
+        batched = isinstance(images, list)
+        blocks = [_to_shared(img) for img in (images if batched else [images])]
+        try:
+            future = self._pool.submit(_worker_call, name, method, [spec for _, spec in blocks], batched)
+            return future.result()
+        finally:
+            for shm, _ in blocks:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,118 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+from model.utils.benchmark import (bench_variants, load_named_images,
+                                   print_variant_report)
+from model.yolo.detect import YOLODetector
+from model.yolo.export import DEFAULT_WEIGHTS, EXPORT_FORMATS
+
+
+def bench_backends(named_images, runs, model_path, image_size, batch_size, formats, labels=None):
+    """Build one detector per export format and compare latency, batch throughput and returned classes.
+
+    Accuracy is the mean per-image F1 of the returned class set against
+    ``labels`` ({filename: [classes]}) when given, else against pt.
+    """
+    images = [img for _, img in named_images]
+
+    def build(fmt):
+        t0 = time.perf_counter()
+        detector = YOLODetector(
+            model_path=model_path, image_size=image_size, batch_size=batch_size, export_format=fmt
+        )
+        print(f'{fmt}: loaded in {time.perf_counter() - t0:.1f}s', end=', ')
+        return detector
+
+    def throughput(fmt, detector):
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            detector.predict_batch(images)
+        rate = runs * len(images) / (time.perf_counter() - t0)
+        print(f'{rate:.1f} images/s with batch_size {batch_size}')
+
+    latencies, outputs = bench_variants(
+        formats,
+        build=build,
+        predict=lambda detector, img: detector.predict_detailed(img),
+        classes=lambda detections: sorted({d['class'] for d in detections}),
+        named_images=named_images,
+        runs=runs,
+        after=throughput,
+    )
+    print_variant_report(
+        '\nYOLO single-image latency:', named_images, latencies, outputs, labels, baseline='pt', column='backend'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare YOLO runtime backends (PyTorch, ONNX, OpenVINO) on the same image set')
+
+    parser.add_argument(
+        '--image',
+        required=True,
+        type=Path,
+        help='Image file or directory of images'
+    )
+    parser.add_argument(
+        '--model_path',
+        type=Path,
+        default=DEFAULT_WEIGHTS,
+        help='Path to model .pt file; exports are cached next to it'
+    )
+    parser.add_argument(
+        '--formats',
+        nargs='+',
+        choices=EXPORT_FORMATS,
+        default=list(EXPORT_FORMATS),
+        help='Backends to compare (default: pt onnx openvino)'
+    )
+    parser.add_argument(
+        '--image_size',
+        type=int,
+        default=640,
+        help='YOLO detection image size (default: 640)'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=16,
+        help='Images per predict call for the throughput pass (default: 16)'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='Maximum number of images to use (default: 20)'
+    )
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=3,
+        help='Timed passes over the image set (default: 3)'
+    )
+    parser.add_argument(
+        '--labels',
+        type=Path,
+        default=None,
+        help='JSON {filename: [classes]} for the held-out set; without it, results are scored against pt'
+    )
+
+    args = parser.parse_args()
+
+    named_images = load_named_images(args.image, args.limit)
+    if not named_images:
+        raise SystemExit(f'No readable images in {args.image}')
+
+    formats = args.formats
+    if args.labels is None and 'pt' not in formats:
+        formats = ['pt'] + formats
+    labels = json.loads(args.labels.read_text()) if args.labels else None
+
+    print(f'\nBenchmarking {formats} on {len(named_images)} image(s), {args.runs} run(s)\n')
+    bench_backends(named_images, args.runs, args.model_path, args.image_size, args.batch_size, formats, labels)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,16 +2,19 @@ import argparse
 import json
 import time
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import cv2
 import matplotlib
 import matplotlib.patches as patches
 import matplotlib.pyplot as plt
 import numpy as np
+import torch
 from ultralytics import YOLO
 
 from model.utils.logger import setup_logger
+from model.utils.tiling import merge_tile_boxes, shift_boxes, slice_image
+from model.yolo.export import EXPORT_FORMATS, ensure_export
 
 
 class YOLODetector:
@@ -21,15 +24,31 @@ class YOLODetector:
         classes_path: Optional[Path] = Path(__file__).parent / "../../assets/classes.txt",
         confidence_threshold: float = 0.25,
         iou_threshold: float = 0.45,
-        image_size: int = 640
+        image_size: int = 640,
+        tile_size: Optional[int] = None,
+        tile_overlap: float = 0.2,
+        tile_batch_size: int = 32,
+        batch_size: int = 16,
+        export_format: str = "pt",
     ):
         self.model_path = model_path
         self.classes_path = classes_path
         self.confidence_threshold = confidence_threshold
         self.iou_threshold = iou_threshold
         self.image_size = image_size
+        # Sliced inference for high-res images (None disables)
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # Upper bound on inputs per predict call once images are expanded into tiles
+        self.tile_batch_size = max(1, tile_batch_size)
+        # Images per model.predict call in predict_batch and predict_folder
+        self.batch_size = max(1, batch_size)
+        assert export_format in EXPORT_FORMATS, f"export_format must be one of {EXPORT_FORMATS}, got {export_format!r}"
+        self.export_format = export_format
 
         self.ingredients = self._load_ingredients()
+        # Object array so class ids map to names with one fancy-index
+        self._names = np.array(self.ingredients, dtype=object)
 
         self.logger = setup_logger(__name__, "yolo.log")
 
@@ -41,57 +60,152 @@ class YOLODetector:
             return [line.strip() for line in f if line.strip()]
 
     def _load_model(self):
-        self.logger.info(f"Loading YOLO model from {self.model_path}...")
-        model = YOLO(str(self.model_path))
+        path = self.model_path
+        if self.export_format != "pt":
+            # Exported once per weights hash and image_size, then reused on every start
+            path = ensure_export(self.model_path, self.export_format, self.image_size, self.logger)
+        self.logger.info(f"Loading YOLO model from {path}...")
+        model = YOLO(str(path), task="detect")
         return model
 
-    def predict_ingredients(self, image_path: Path) -> List[str]:
-        detections = self.predict_detailed(image_path)
-        return sorted({d['class'] for d in detections})
-
-    def predict_detailed(self, image_path: Path) -> List[dict]:
-        start_time = time.time()
-        self.logger.info(f"YOLO analyzing image: {image_path}")
+    def _as_source(self, image: Union[Path, np.ndarray]):
+        # Ultralytics treats arrays as BGR, our in-memory images are RGB
+        if isinstance(image, np.ndarray):
+            return np.ascontiguousarray(image[..., ::-1])
+        return str(image)
+
+    def _describe(self, image: Union[Path, np.ndarray]) -> str:
+        if isinstance(image, np.ndarray):
+            return f"<array {image.shape[1]}x{image.shape[0]}>"
+        return str(image)
+
+    def _tiles(self, image: Union[Path, np.ndarray]):
+        """(sources, offsets) for one image: just the image, or its overlapping BGR tiles."""
+        source = self._as_source(image)
+        if not self.tile_size:
+            return [source], [(0, 0)]
+        if not isinstance(source, np.ndarray):
+            source = cv2.imread(source)
+            if source is None:
+                raise ValueError(f"Could not read image: {image}")
+        return slice_image(source, self.tile_size, self.tile_overlap)
+
+    def _collect(self, results, offsets) -> List[dict]:
+        """Detections from the results for one image's tiles, merged with cross-tile NMS."""
+        boxes, scores, classes = [], [], []
+        for result, offset in zip(results, offsets):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            boxes.append(shift_boxes(result.boxes.xyxy, offset))
+            scores.append(result.boxes.conf)
+            classes.append(result.boxes.cls.long())
+        if not boxes:
+            return []
 
-        try:
-            results = self.model.predict(
-                source=str(image_path),
+        boxes, scores, classes = torch.cat(boxes), torch.cat(scores), torch.cat(classes)
+        if len(results) > 1:
+            keep = merge_tile_boxes(boxes, scores, classes, self.iou_threshold)
+            boxes, scores, classes = boxes[keep], scores[keep], classes[keep]
+
+        valid = (classes >= 0) & (classes < len(self.ingredients))
+        # One device-to-host copy for all of the image's boxes; float64 so rounding
+        # yields clean values like 0.8123 rather than float32 noise in the JSON
+        rows = torch.cat([boxes, scores[:, None], classes[:, None].float()], dim=1)[valid].cpu().numpy()
+        rows = rows.astype(np.float64)
+        names = self._names[rows[:, 5].astype(np.int64)]
+        return [
+            {'class': name, 'confidence': conf, 'box': box}
+            for name, conf, box in zip(names, rows[:, 4].round(4).tolist(), rows[:, :4].round(1).tolist())
+        ]
+
+    def _predict(self, images: List[Union[Path, np.ndarray]]) -> List[List[dict]]:
+        """Run several images (and their tiles) through YOLO, tile_batch_size inputs per predict call when tiling."""
+        sources, spans = [], []
+        for image in images:
+            image_sources, offsets = self._tiles(image)
+            spans.append((len(sources), len(sources) + len(image_sources), offsets))
+            sources.extend(image_sources)
+
+        chunk = self.tile_batch_size if self.tile_size else max(1, len(sources))
+        results = []
+        for start in range(0, len(sources), chunk):
+            results += self.model.predict(
+                source=sources[start:start + chunk],
                 conf=self.confidence_threshold,
                 iou=self.iou_threshold,
                 imgsz=self.image_size,
                 verbose=False
             )
+        return [self._collect(results[start:end], offsets) for start, end, offsets in spans]
 
-            detections = []
+    def predict_ingredients(self, image: Union[Path, np.ndarray]) -> List[str]:
+        detections = self.predict_detailed(image)
+        return sorted({d['class'] for d in detections})
 
-            for result in results:
-                if result.boxes is not None and len(result.boxes) > 0:
-                    for box in result.boxes:
-                        class_id = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        xyxy = box.xyxy[0].tolist()
+    def predict_detailed(self, image: Union[Path, np.ndarray]) -> List[dict]:
+        """Detect ingredients in an image file or an in-memory RGB array."""
+        start_time = time.time()
+        image_desc = self._describe(image)
+        self.logger.info(f"YOLO analyzing image: {image_desc}")
 
-                        if 0 <= class_id < len(self.ingredients):
-                            detections.append({
-                                'class': self.ingredients[class_id],
-                                'confidence': round(conf, 4),
-                                'box': [round(v, 1) for v in xyxy],
-                            })
+        try:
+            # With tiling, all tiles (plus the full image) go through YOLO as one batch
+            detections = self._predict([image])[0]
 
             elapsed_time = time.time() - start_time
-            self.logger.info(f"YOLO detected {len(detections)} ingredients in {image_path} (took {elapsed_time:.2f}s)")
+            self.logger.info(f"YOLO detected {len(detections)} ingredients in {image_desc} (took {elapsed_time:.2f}s)")
             return detections
 
         except Exception as e:
-            self.logger.error(f"Error analyzing image {image_path}: {e}")
+            self.logger.error(f"Error analyzing image {image_desc}: {e}")
             return []
 
-    def predict_folder(self, folder: Path) -> Dict[str, List[str]]:
-        outputs = {}
-        for img in folder.iterdir():
-            if img.suffix.lower() in self.image_exts:
-                outputs[img.name] = self.predict_ingredients(img)
-        return outputs
+    def predict_batch(self, images: List[np.ndarray]) -> List[List[dict]]:
+        """predict_detailed for several in-memory RGB arrays, batch_size images per predict call."""
+        start_time = time.time()
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            try:
+                results.extend(self._predict(chunk))
+            except Exception as e:
+                self.logger.error(f"Error analyzing a batch of {len(chunk)} images: {e}")
+                results.extend([] for _ in chunk)
+
+        elapsed_time = time.time() - start_time
+        self.logger.info(f"YOLO scored a batch of {len(images)} images (took {elapsed_time:.2f}s)")
+        return results
+
+    def iter_paths(
+        self,
+        paths: List[Path],
+        batch_size: Optional[int] = None,
+    ) -> Iterator[Tuple[Path, Optional[np.ndarray], List[dict]]]:
+        """Stream (path, RGB image, detections) per file, predicting batch_size images at a time.
+
+        Unreadable files yield (path, None, []).
+        """
+        batch_size = batch_size or self.batch_size
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            images = []
+            for path in chunk:
+                img_bgr = cv2.imread(str(path))
+                if img_bgr is None:
+                    self.logger.error(f"Could not read image: {path}")
+                images.append(None if img_bgr is None else cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
+
+            readable = [img for img in images if img is not None]
+            detections = iter(self.predict_batch(readable) if readable else [])
+            for path, img in zip(chunk, images):
+                yield path, img, next(detections) if img is not None else []
+
+    def predict_folder(self, folder: Path, batch_size: Optional[int] = None) -> Dict[str, List[str]]:
+        paths = sorted(p for p in folder.iterdir() if p.suffix.lower() in self.image_exts)
+        return {
+            path.name: sorted({d['class'] for d in detections})
+            for path, _, detections in self.iter_paths(paths, batch_size)
+        }
 
 
 def visualise_and_save(img_rgb, detections, out_path):
@@ -164,6 +278,36 @@ def main():
         default=640,
         help='YOLO detection image size (default: 640)'
     )
+    parser.add_argument(
+        '--tile_size',
+        type=int,
+        default=None,
+        help='Run on overlapping tiles of this size in pixels (default: off)'
+    )
+    parser.add_argument(
+        '--tile_overlap',
+        type=float,
+        default=0.2,
+        help='Fractional overlap between neighbouring tiles (default: 0.2)'
+    )
+    parser.add_argument(
+        '--tile_batch_size',
+        type=int,
+        default=32,
+        help='Maximum tiles per YOLO predict call when tiling (default: 32)'
+    )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=16,
+        help='Images per YOLO predict call (default: 16)'
+    )
+    parser.add_argument(
+        '--export_format',
+        choices=EXPORT_FORMATS,
+        default='pt',
+        help='Runtime: pt (PyTorch), or an onnx/openvino export cached next to the weights (default: pt)'
+    )
     parser.add_argument(
         '--output',
         type=Path,
@@ -190,6 +334,11 @@ def main():
         confidence_threshold=args.confidence_threshold,
         iou_threshold=args.iou_threshold,
         image_size=args.image_size,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+        tile_batch_size=args.tile_batch_size,
+        batch_size=args.batch_size,
+        export_format=args.export_format,
     )
 
     if args.visualise:
@@ -204,23 +353,19 @@ def main():
     print(f'\nRunning on {len(img_paths)} image(s)...\n')
 
     all_results = {}
-    for path in img_paths:
-        t0 = time.time()
-
-        detections = detector.predict_detailed(path)
-        elapsed = time.time() - t0
-
-        print(f'{path.name}  [{elapsed:.1f}s]  {len(detections)} detections')
+    t0 = time.time()
+    for path, img_rgb, detections in detector.iter_paths(img_paths, args.batch_size):
+        print(f'{path.name}  {len(detections)} detections')
         for d in detections:
             print(f'  {d["class"]:<30} conf={d["confidence"]:.3f}  box={d["box"]}')
 
         all_results[path.name] = detections
 
         if args.visualise and detections:
-            img_bgr = cv2.imread(str(path))
-            if img_bgr is not None:
-                img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-                visualise_and_save(img_rgb, detections, args.vis_dir / f'{path.stem}_vis.jpg')
+            visualise_and_save(img_rgb, detections, args.vis_dir / f'{path.stem}_vis.jpg')
+
+    elapsed = time.time() - t0
+    print(f'\n{len(img_paths)} image(s) in {elapsed:.1f}s ({elapsed / max(1, len(img_paths)):.2f}s per image)')
 
     if args.output:
         with open(args.output, 'w') as f:
@@ -0,0 +1,110 @@
+import argparse
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from ultralytics import YOLO
+
+# 'pt' loads best.pt through Ultralytics' PyTorch path; the others are exported once and cached
+EXPORT_FORMATS = ('pt', 'onnx', 'openvino')
+DEFAULT_WEIGHTS = Path(__file__).resolve().parent / 'assets' / 'best.pt'
+# Runtime packages per format; they live in requirements-export.txt, not the base image
+RUNTIMES = {'onnx': ('onnx', 'onnxruntime'), 'openvino': ('openvino',)}
+
+
+def weights_hash(path, chunk_size=1 << 20):
+    """Short content hash of a weights file, so retrained weights never reuse a stale export."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def export_path(model_path, fmt, image_size):
+    """Where the export of ``model_path`` lives: next to it, keyed on the weights hash and input size.
+
+    OpenVINO exports are directories; Ultralytics recognizes them by the
+    ``_openvino_model`` suffix.
+    """
+    model_path = Path(model_path)
+    stem = f'{model_path.stem}-{weights_hash(model_path)}-{image_size}'
+    suffix = {'onnx': '.onnx', 'openvino': '_openvino_model'}[fmt]
+    return model_path.parent / f'{stem}{suffix}'
+
+
+def require_runtime(fmt):
+    """Fail early with an install hint, rather than letting Ultralytics pip-install at run time."""
+    missing = [pkg for pkg in RUNTIMES[fmt] if importlib.util.find_spec(pkg) is None]
+    if missing:
+        raise ImportError(
+            f"YOLO export format {fmt!r} needs {', '.join(missing)}: pip install -r model/requirements-export.txt"
+        )
+
+
+def ensure_export(model_path, fmt, image_size, logger=None):
+    """Path of the cached export, running the Ultralytics export first if it is missing."""
+    require_runtime(fmt)
+    target = export_path(model_path, fmt, image_size)
+    if target.exists():
+        return target
+
+    if logger:
+        logger.info(f'Exporting {Path(model_path).name} to {fmt} (imgsz {image_size})...')
+    t0 = time.time()
+    # Export from a private copy: Ultralytics writes its output next to the
+    # weights under a fixed name, which concurrent workers would fight over
+    with tempfile.TemporaryDirectory(dir=Path(model_path).parent, prefix='.export-') as tmp:
+        src = Path(tmp) / Path(model_path).name
+        shutil.copy2(model_path, src)
+        # Dynamic axes so predict_batch can send several images per call
+        out = YOLO(str(src)).export(format=fmt, imgsz=image_size, dynamic=True, verbose=False)
+        try:
+            os.replace(out, target)
+        except OSError:
+            # Another process finished the same export first
+            if not target.exists():
+                raise
+
+    if logger:
+        logger.info(f'Exported {target.name} in {time.time() - t0:.1f}s')
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-build the cached ONNX/OpenVINO exports of the YOLO weights')
+
+    parser.add_argument(
+        '--model_path',
+        type=Path,
+        default=DEFAULT_WEIGHTS,
+        help='Path to model .pt file; exports are written next to it'
+    )
+    parser.add_argument(
+        '--format',
+        nargs='+',
+        choices=EXPORT_FORMATS[1:],
+        default=['onnx'],
+        help='Export format(s) (default: onnx)'
+    )
+    parser.add_argument(
+        '--image_size',
+        type=int,
+        default=640,
+        help='YOLO detection image size the export is built for (default: 640)'
+    )
+
+    args = parser.parse_args()
+
+    for fmt in args.format:
+        cached = export_path(args.model_path, fmt, args.image_size).exists()
+        path = ensure_export(args.model_path, fmt, args.image_size)
+        print(f'{fmt}: {path}{" (cached)" if cached else ""}')
+
+
+if __name__ == '__main__':
+    main()